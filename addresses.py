@@ -0,0 +1,256 @@
+import hashlib
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# Recent classify() results kept in memory.
+CLASSIFY_CACHE_SIZE = 4096
+
+EVM_CHAINS = ("eth", "base", "arb", "gnosis", "bera")
+
+NEAR_RE = re.compile(r'^(([a-z\d]+[-_])*[a-z\d]+\.)*([a-z\d]+[-_])*[a-z\d]+$')
+EVM_RE = re.compile(r'^0x[a-fA-F0-9]{40}$')
+BASE58_RE = re.compile(r'^[1-9A-HJ-NP-Za-km-z]+$')
+
+# Base58Check version bytes.
+BTC_VERSIONS = {b"\x00": "p2pkh", b"\x05": "p2sh"}
+DOGE_VERSIONS = {b"\x1e": "p2pkh", b"\x16": "p2sh"}
+ZCASH_VERSIONS = {b"\x1c\xb8": "p2pkh", b"\x1c\xbd": "p2sh"}
+ZCASH_TESTNET_VERSIONS = {b"\x1d\x25", b"\x1c\xba", b"\x16\xb6"}
+ZCASH_SPROUT_VERSION = b"\x16\x9a"
+
+SAPLING_HRP = "zs"
+UNIFIED_HRP = "u"
+ZCASH_TESTNET_HRPS = ("ztestsapling", "utest", "uregtest", "zregtestsapling")
+
+# ZIP 316 receiver typecodes and their lengths.
+UNIFIED_RECEIVERS = {0x00: ("p2pkh", 20), 0x01: ("p2sh", 20), 0x02: ("sapling", 43), 0x03: ("orchard", 43)}
+
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32_CONST = 1
+BECH32M_CONST = 0x2bc830a3
+
+BECH32_GENERATOR = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+# Generator terms for every value of the top five checksum bits.
+_POLYMOD_TABLE = [0] * 32
+for _top in range(32):
+    for _i, _g in enumerate(BECH32_GENERATOR):
+        if (_top >> _i) & 1:
+            _POLYMOD_TABLE[_top] ^= _g
+
+AddressInfo = namedtuple("AddressInfo", ["chains", "zcash_type", "ambiguous"])
+AddressInfo.__doc__ = """Result of classify().
+
+`chains` lists the supported chains the address is valid on. `zcash_type`
+is the z_validateaddress address_type for Zcash addresses. `ambiguous` is
+set when only zcashd can tell whether the address is a valid Zcash
+address, e.g. testnet encodings.
+"""
+
+
+def _polymod(values):
+    chk = 1
+    for value in values:
+        chk = ((chk & 0x1ffffff) << 5 ^ value) ^ _POLYMOD_TABLE[chk >> 25]
+    return chk
+
+
+def bech32_decode(address, max_length=90):
+    """Returns (hrp, 5-bit data, "bech32" | "bech32m") or None when the checksum does not match.
+
+    Unified addresses are longer than BIP 173 allows; pass max_length=None for them.
+    """
+    if max_length and len(address) > max_length or address.lower() != address and address.upper() != address:
+        return None
+    address = address.lower()
+    pos = address.rfind("1")
+    if pos < 1 or pos + 7 > len(address):
+        return None
+
+    hrp = address[:pos]
+    try:
+        data = [BECH32_CHARSET.index(c) for c in address[pos + 1:]]
+    except ValueError:
+        return None
+
+    const = _polymod([ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp] + data)
+    if const == BECH32_CONST:
+        return hrp, data[:-6], "bech32"
+    if const == BECH32M_CONST:
+        return hrp, data[:-6], "bech32m"
+    return None
+
+
+def _convert_bits(data, from_bits, to_bits, pad):
+    acc = bits = 0
+    out = []
+    maxv = (1 << to_bits) - 1
+    for value in data:
+        acc = (acc << from_bits) | value
+        bits += from_bits
+        while bits >= to_bits:
+            bits -= to_bits
+            out.append((acc >> bits) & maxv)
+    if pad:
+        if bits:
+            out.append((acc << (to_bits - bits)) & maxv)
+    elif bits >= from_bits or (acc << (to_bits - bits)) & maxv:
+        return None
+    return bytes(out)
+
+
+def _f4_h(i, u, length):
+    return hashlib.blake2b(u, digest_size=length, person=b"UA_F4Jumble_H" + bytes([i, 0, 0])).digest()
+
+
+def _f4_g(i, u, length):
+    out = b"".join(
+        hashlib.blake2b(u, person=b"UA_F4Jumble_G" + bytes([i]) + j.to_bytes(2, "little")).digest()
+        for j in range((length + 63) // 64)
+    )
+    return out[:length]
+
+
+def _xor(a, b):
+    return (int.from_bytes(a, "little") ^ int.from_bytes(b[:len(a)], "little")).to_bytes(len(a), "little")
+
+
+def f4jumble_inv(message):
+    """Inverts the ZIP 316 F4Jumble permutation."""
+    left = min(64, len(message) // 2)
+    right = len(message) - left
+    c, d = message[:left], message[left:]
+    y = _xor(c, _f4_h(1, d, left))
+    x = _xor(d, _f4_g(1, y, right))
+    a = _xor(y, _f4_h(0, x, left))
+    b = _xor(x, _f4_g(0, a, right))
+    return a + b
+
+
+def _unified_receivers(data, hrp):
+    """Returns the receiver names of a decoded unified address, or None if it is malformed."""
+    raw = _convert_bits(data, 5, 8, False)
+    if raw is None or not 48 <= len(raw) <= 4194368:
+        return None
+
+    raw = f4jumble_inv(raw)
+    if raw[-16:] != hrp.encode().ljust(16, b"\0"):
+        return None
+
+    receivers = []
+    pos, end, last = 0, len(raw) - 16, -1
+    while pos < end:
+        typecode, pos = _compact_size(raw, pos)
+        length, pos = _compact_size(raw, pos)
+        if typecode is None or length is None or typecode <= last or pos + length > end:
+            return None
+        name, expected = UNIFIED_RECEIVERS.get(typecode, ("unknown", length))
+        if length != expected:
+            return None
+        receivers.append(name)
+        last, pos = typecode, pos + length
+
+    return receivers
+
+
+def _compact_size(raw, pos):
+    if pos >= len(raw):
+        return None, pos
+    first = raw[pos]
+    if first < 0xfd:
+        return first, pos + 1
+    size = {0xfd: 2, 0xfe: 4, 0xff: 8}[first]
+    if pos + 1 + size > len(raw):
+        return None, pos
+    return int.from_bytes(raw[pos + 1:pos + 1 + size], "little"), pos + 1 + size
+
+
+def _base58check(address):
+    if not BASE58_RE.match(address):
+        return None
+
+    import base58
+    try:
+        return base58.b58decode_check(address)
+    except ValueError:
+        return None
+
+
+def _classify_base58(address):
+    payload = _base58check(address)
+    if payload is None:
+        return (), None, False
+
+    if len(payload) == 21:
+        if payload[:1] in BTC_VERSIONS:
+            return ("btc",), None, False
+        if payload[:1] in DOGE_VERSIONS:
+            return ("doge",), None, False
+    elif len(payload) == 22:
+        if payload[:2] in ZCASH_VERSIONS:
+            return ("zec",), ZCASH_VERSIONS[payload[:2]], False
+        if payload[:2] in ZCASH_TESTNET_VERSIONS:
+            return (), None, True
+    elif len(payload) == 66 and payload[:2] == ZCASH_SPROUT_VERSION:
+        return ("zec",), "sprout", False
+    return (), None, False
+
+
+def _classify_bech32(address):
+    decoded = bech32_decode(address, max_length=None)
+    if decoded is None:
+        return (), None, False
+    hrp, data, encoding = decoded
+    if len(address) > 90 and hrp not in (UNIFIED_HRP, "utest", "uregtest"):
+        return (), None, False
+
+    if hrp == "bc" and data:
+        version = data[0]
+        program = _convert_bits(data[1:], 5, 8, False)
+        if program is None or version > 16 or not 2 <= len(program) <= 40:
+            return (), None, False
+        if version == 0 and (encoding != "bech32" or len(program) not in (20, 32)):
+            return (), None, False
+        if version > 0 and encoding != "bech32m":
+            return (), None, False
+        return ("btc",), None, False
+
+    if hrp == SAPLING_HRP and encoding == "bech32":
+        program = _convert_bits(data, 5, 8, False)
+        if program is not None and len(program) == 43:
+            return ("zec",), "sapling", False
+        return (), None, False
+
+    if hrp == UNIFIED_HRP and encoding == "bech32m":
+        receivers = _unified_receivers(data, hrp)
+        if receivers is None:
+            return (), None, False
+        if "sapling" in receivers or "orchard" in receivers:
+            return ("zec",), "unified", False
+        # Unified addresses need a shielded receiver; leave newer receiver types to zcashd.
+        return (), None, "unknown" in receivers
+
+    if hrp in ZCASH_TESTNET_HRPS:
+        return (), None, True
+    return (), None, False
+
+
+@lru_cache(maxsize=CLASSIFY_CACHE_SIZE)
+def classify(address):
+    """Classifies an address for the chains the agent withdraws to, without any network call."""
+    chains = []
+    zcash_type = None
+    ambiguous = False
+
+    if NEAR_RE.match(address):
+        chains.append("near")
+
+    if EVM_RE.match(address):
+        chains.extend(EVM_CHAINS)
+    else:
+        found, zcash_type, ambiguous = _classify_base58(address)
+        if not found and not ambiguous and "1" in address:
+            found, zcash_type, ambiguous = _classify_bech32(address)
+        chains.extend(found)
+
+    return AddressInfo(tuple(chains), zcash_type, ambiguous)
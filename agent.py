@@ -1,27 +1,28 @@
-import asyncio
 import json
+from decimal import Decimal
 
+import runtime
 import utils
 import zcash
+from jobs import scheduler
+from journal import complete, get_journal, resume_all, resumes
+from render import render_tokens
+from streaming import print_progress, stream_completion, run_tool_calls
+from tokens import catalog, registry
 
 from nearai.agents.environment import Environment
 
-from rich.console import Console
-from rich.markdown import Markdown
 from rich import print as rprint
 
 from intents.deposit import _deposit_to_intents
 from intents.swap import intent_swap
 from intents.withdraw import withdraw_from_intents
-from io import StringIO
 
 import sys
 
 # env:Environment = Environment()
-console = Console()
 
-with open("tokens.json", "r") as file:
-    data = json.load(file)
+data = registry
 
 with open("env", "r") as file:
     env_vars = json.load(file)
@@ -41,13 +42,24 @@ with open("env", "r") as file:
 
 # env:Environment
 
-with open("tokens.json", "r") as file:
-    data = json.load(file)
-
 def get_all_tokens():
     """Gets all the tokens supported with relevant metadata. Use this tool to get the tokens supported. This tool is not intended for direct calls by users."""
-    data = utils.load_url("https://api-mng-console.chaindefuser.com/api/tokens")
-    return data["items"]
+    return catalog.registry().tokens
+
+def token_info(symbol = "", blockchain = ""):
+    """Looks up supported tokens. Call this tool when you need a token's defuse asset id, contract address, decimals or minimum withdraw amount, or to check whether a token is supported on a chain. Set symbol and/or blockchain to filter, e.g. symbol "USDC" or blockchain "eth"."""
+    tokens = catalog.registry()
+    matches = [token for token in tokens
+               if (not symbol or token["symbol"].upper() == symbol.upper())
+               and (not blockchain or token["blockchain"] == blockchain.lower())]
+
+    if not matches:
+        env.add_reply(f"No supported token matches symbol '{symbol}' on chain '{blockchain}'")
+        return []
+
+    matches = [dict(token, min_withdraw_amount=str(Decimal(token.get("min_withdraw_amount") or 0) / tokens.scale(token))) for token in matches]
+    env.add_reply(render_tokens(matches))
+    return matches
 
 def wallet_balance(accountId = env.env_vars.get("ACCOUNT_ID", "")):
     """ Request Handling for Wallet Balance
@@ -56,7 +68,7 @@ def wallet_balance(accountId = env.env_vars.get("ACCOUNT_ID", "")):
         Ambiguous Request: If the user simply types "balance" or you are unsure about their intent, ask them if they want to check their wallet balance. If they confirm, proceed with calling this tool.
     """
     accountId = accountId if ((accountId != "") or (accountId != None)) else  env.env_vars.get("ACCOUNT_ID", "")
-    token_balances = asyncio.run(utils._wallet_balance(env, accountId, data))
+    token_balances = runtime.run(utils._wallet_balance(env, accountId))
     utils.reply_with_markdown(env, token_balances, f"wallet balance of {accountId}")
 
 def Intents_balance(accountId = env.env_vars.get("ACCOUNT_ID", "")):
@@ -66,12 +78,21 @@ def Intents_balance(accountId = env.env_vars.get("ACCOUNT_ID", "")):
         Ambiguous Request: If the user simply types "balance" or you are unsure about their intent, ask them if they want to check their Intents balance. If they confirm, proceed with calling this tool.
     """
     accountId = accountId if ((accountId != "") or (accountId != None)) else  env.env_vars.get("ACCOUNT_ID", "")
-    token_balances = asyncio.run(utils._Intents_balance(env, accountId, data))
+    token_balances = runtime.run(utils._Intents_balance(env, accountId))
     utils.reply_with_markdown(env, token_balances, f"Intents balance of {accountId}")
 
+def _chains_for(token_symbol):
+    return ("zec",) if token_symbol.upper() == "ZEC" else ("near",)
+
+
+def _started(job_id, what):
+    env.add_reply(f"Started job {job_id}: {what}. Ask for the job status to follow it.")
+    return job_id
+
+
 def deposit_to_intents(amount, token_symbol="", sender = env.env_vars.get("ACCOUNT_ID", None)):
     
-    """Always re-ask for user confirmation regarding the amount and the token before calling the tool each time. This tool deposits a token to the intents contract. You can call this tool if user asks to deposit into defuse/intents contract, after user confirmation regarding the amount and the token. Take the amount and token symbol from the user, and call this tool."""
+    """Always re-ask for user confirmation regarding the amount and the token before calling the tool each time. This tool deposits a token to the intents contract. You can call this tool if user asks to deposit into defuse/intents contract, after user confirmation regarding the amount and the token. Take the amount and token symbol from the user, and call this tool. The deposit runs in the background and the tool returns a job id."""
     
     if token_symbol.upper() == "ZEC":
         if (sender == env.env_vars.get("ACCOUNT_ID", None)):
@@ -79,40 +100,41 @@ def deposit_to_intents(amount, token_symbol="", sender = env.env_vars.get("ACCOU
         sender = sender if sender != "" else  env.env_vars.get("ZCASH_ADDRESS", None)
     else:    
         sender = sender if sender != "" else  env.env_vars.get("ACCOUNT_ID", None)
-        
-    with console.status(f"[bold green]Depositing {amount} {token_symbol}... This may take up to 15 minutes.[/bold green]"):
-        asyncio.run(_deposit_to_intents(env, data, amount, sender, token_symbol))
+
+    flow = get_journal().start("deposit", {"amount": str(amount), "sender": sender, "token_symbol": token_symbol})
+    job_id = scheduler.submit(env, f"deposit {amount} {token_symbol}", _chains_for(token_symbol),
+                              lambda job_env: _deposit_to_intents(job_env, data, amount, sender, token_symbol, flow), flow)
+    return _started(job_id, f"depositing {amount} {token_symbol}, this may take up to 15 minutes")
 
 
 def swap_in_intents(token_in, amount_in, token_out):
-    """Always re-ask for user confirmation regarding the amount and the token-in and token-out before calling the tool each time. This tool swaps token-in to token-out inside defuse/intents. Remember, this is a swap inside intents, and not a swap in the user's wallet. You can call this tool if user asks to swap inside defuse/intents contract, after user confirmation regarding the amount-in, token-in and token-out. Take the amount and token symbols from the user, and call this tool."""
-    with console.status(f"[bold green]Swapping {amount_in} {token_in} to {token_out}...[/bold green]"):
-        asyncio.run(intent_swap(env, token_in, token_out, amount_in, data))
+    """Always re-ask for user confirmation regarding the amount and the token-in and token-out before calling the tool each time. This tool swaps token-in to token-out inside defuse/intents. Remember, this is a swap inside intents, and not a swap in the user's wallet. You can call this tool if user asks to swap inside defuse/intents contract, after user confirmation regarding the amount-in, token-in and token-out. Take the amount and token symbols from the user, and call this tool. The swap runs in the background and the tool returns a job id."""
+    flow = get_journal().start("intent_swap", {"token_in": token_in, "token_out": token_out, "amount_in": str(amount_in),
+                                               "contract_in": "", "contract_out": ""})
+    job_id = scheduler.submit(env, f"swap {amount_in} {token_in} to {token_out}", ("near",),
+                              lambda job_env: intent_swap(job_env, token_in, token_out, amount_in, data, flow=flow), flow)
+    return _started(job_id, f"swapping {amount_in} {token_in} to {token_out}")
 
-def _withdraw_from_intents(amount, token_symbol="", receiverId = env.env_vars.get("ACCOUNT_ID", None)):
-    """Before calling the tool, always reconfirm with the user regarding the amount and token they want to withdraw. If the user requests a withdrawal from the defuse/intents contract, explicitly ask for confirmation on the amount and token symbol before proceeding.
 
-    Additionally, verify the receiver account ID:
-    If the user provides a receiver id, then set reciverId to that
-    Only after receiving explicit confirmation on these details should you proceed with calling the tool."""
-    
+def _withdraw_target(token_symbol, receiverId):
+    """Validates the receiver and asks for the chain when several match. Returns (receiverId, token_data) or None."""
     receiverId = receiverId if receiverId else env.env_vars.get("ACCOUNT_ID", None)
 
     if token_symbol.upper() == "ZEC":
         if (receiverId == env.env_vars.get("ACCOUNT_ID", None)):
             receiverId = env.env_vars.get("ZCASH_ADDRESS", None)
 
-    valid_chains = utils.getAddressChains(env, receiverId)
+    valid_chains = runtime.run(utils.getAddressChains(env, receiverId))
 
     if not valid_chains:
         env.add_reply(f"It seems {receiverId} is not a valid address for any chain we support")
-        return False
+        return None
 
-    match = [obj for obj in data if obj["symbol"] == token_symbol.upper() and obj["blockchain"] in valid_chains]
+    match = data.by_symbol_chains(token_symbol, valid_chains)
 
     if not match:
       env.add_reply(f"Token {token_symbol} may not be supported for withdrawing into {receiverId} for chains {valid_chains}. Please confirm your token and address again.")
-      return False
+      return None
 
     while len(match) > 1:
         rprint(f"To which blockchain do you wish to withdraw? Do make sure to write the exact chain.")
@@ -122,73 +144,134 @@ def _withdraw_from_intents(amount, token_symbol="", receiverId = env.env_vars.ge
     
         if not match:
             env.add_reply(f"Token {token_symbol} may not be supported for withdrawing into {receiverId} for chain {chain}. Please confirm your token and address again.")
-            return False
-        
-    token_data = match[0]
-    
+            return None
+
     if token_symbol.upper() == "ZEC":
-        with console.status(f"[bold green]Withdrawing {amount} {token_symbol}... This may take up to 15 minutes.[/bold green]"):    
-            receiverId = receiverId if receiverId else  env.env_vars.get("ZCASH_ADDRESS", None)
-            asyncio.run(zcash.withdraw(env, token_symbol, amount, receiverId, data))
-            return
+        receiverId = receiverId if receiverId else  env.env_vars.get("ZCASH_ADDRESS", None)
 
-    with console.status(f"[bold green]Withdrawing {amount} {token_symbol}... This may take up to 15 minutes.[/bold green]"):    
-        asyncio.run(withdraw_from_intents(env, token_symbol, amount, receiverId, data, token_data))
+    return receiverId, match[0]
 
-def swap(token_in, amount_in, token_out, receiverId = env.env_vars.get("ACCOUNT_ID", None), sender = env.env_vars.get("ACCOUNT_ID", None)):
-    """Before calling the tool, always reconfirm with the user regarding the amount and token they want to swap. This tool swaps token-in to token-out in the user's wallet. It deposits, then swaps and then withdraws to the withdrawal address. This is not to be called if the swap is in the intents contract."""
-    
-    with console.status(f"[bold green]Depositing {amount_in} {token_in}... This may take up to 15 minutes.[/bold green]"):
-        if token_in.upper() == "ZEC":
-            if (sender == env.env_vars.get("ACCOUNT_ID", None)):
-                sender = env.env_vars.get("ZCASH_ADDRESS", None)
-            sender = sender if sender != "" else  env.env_vars.get("ZCASH_ADDRESS", None)
-
-        else:    
-            sender = sender if sender != "" else  env.env_vars.get("ACCOUNT_ID", None)
-        asyncio.run(_deposit_to_intents(env, data, amount_in, sender, token_in))
-
-    with console.status(f"[bold green]Swapping {amount_in} {token_in} to {token_out}...[/bold green]"):
-        amount = asyncio.run(intent_swap(env, token_in, token_out, amount_in, data))
-        
-    receiverId = receiverId if receiverId else env.env_vars.get("ACCOUNT_ID", None)
 
-    if token_out.upper() == "ZEC":
-        if (receiverId == env.env_vars.get("ACCOUNT_ID", None)):
-            receiverId = env.env_vars.get("ZCASH_ADDRESS", None)
+def _withdraw(job_env, token_symbol, amount, receiverId, token_data, flow):
+    if token_symbol.upper() == "ZEC":
+        return zcash.withdraw(job_env, token_symbol, amount, receiverId, data, flow)
+    return withdraw_from_intents(job_env, token_symbol, amount, receiverId, data, token_data, flow)
 
-    valid_chains = utils.getAddressChains(env, receiverId)
 
-    if not valid_chains:
-        env.add_reply(f"It seems {receiverId} is not a valid address for any chain we support")
-        return False
+def _withdraw_from_intents(amount, token_symbol="", receiverId = env.env_vars.get("ACCOUNT_ID", None)):
+    """Before calling the tool, always reconfirm with the user regarding the amount and token they want to withdraw. If the user requests a withdrawal from the defuse/intents contract, explicitly ask for confirmation on the amount and token symbol before proceeding.
 
-    match = [obj for obj in data if obj["symbol"] == token_out.upper() and obj["blockchain"] in valid_chains]
+    Additionally, verify the receiver account ID:
+    If the user provides a receiver id, then set reciverId to that
+    Only after receiving explicit confirmation on these details should you proceed with calling the tool.
+    The withdrawal runs in the background and the tool returns a job id."""
 
-    if not match:
-        env.add_reply(f"Token {token_out} may not be supported for withdrawing into {receiverId} for chains {valid_chains}. Please confirm your token and address again.")
+    target = _withdraw_target(token_symbol, receiverId)
+    if target is None:
         return False
+    receiverId, token_data = target
 
-    while len(match) > 1:
-        rprint(f"To which blockchain do you wish to withdraw? Do make sure to write the exact chain.")
-        rprint([data["blockchain"] for data in match])
-        chain = input("> ")
-        match = [obj for obj in match if obj["blockchain"] == chain]
+    if token_symbol.upper() == "ZEC":
+        flow = get_journal().start("zec_withdraw", {"token": token_symbol, "amount": str(amount), "recipient": receiverId})
+    else:
+        flow = get_journal().start("intents_withdraw", {"token": token_symbol, "amount": str(amount), "receiver_id": receiverId})
+
+    job_id = scheduler.submit(env, f"withdraw {amount} {token_symbol} to {receiverId}", ("near",) + _chains_for(token_symbol),
+                              lambda job_env: _withdraw(job_env, token_symbol, amount, receiverId, token_data, flow), flow)
+    return _started(job_id, f"withdrawing {amount} {token_symbol} to {receiverId}, this may take up to 15 minutes")
+
+
+def swap(token_in, amount_in, token_out, receiverId = env.env_vars.get("ACCOUNT_ID", None), sender = env.env_vars.get("ACCOUNT_ID", None)):
+    """Before calling the tool, always reconfirm with the user regarding the amount and token they want to swap. This tool swaps token-in to token-out in the user's wallet. It deposits, then swaps and then withdraws to the withdrawal address. This is not to be called if the swap is in the intents contract. The swap runs in the background and the tool returns a job id."""
     
-        if not match:
-            env.add_reply(f"Token {token_out} may not be supported for withdrawing into {receiverId} for chain {chain}. Please confirm your token and address again.")
+    if token_in.upper() == "ZEC":
+        if (sender == env.env_vars.get("ACCOUNT_ID", None)):
+            sender = env.env_vars.get("ZCASH_ADDRESS", None)
+        sender = sender if sender != "" else  env.env_vars.get("ZCASH_ADDRESS", None)
+
+    else:    
+        sender = sender if sender != "" else  env.env_vars.get("ACCOUNT_ID", None)
+
+    # The withdrawal target may need the user's input, so settle it before going to the background.
+    target = _withdraw_target(token_out, receiverId)
+    if target is None:
+        return False
+    receiverId, token_data = target
+
+    flow = get_journal().start("swap", {"token_in": token_in, "amount_in": str(amount_in), "token_out": token_out,
+                                        "receiverId": receiverId, "sender": sender})
+    flow.record("target", receiver=receiverId, asset_id=token_data["defuse_asset_id"])
+
+    job_id = scheduler.submit(env, f"swap {amount_in} {token_in} to {token_out}", ("near",) + _chains_for(token_in) + _chains_for(token_out),
+                              lambda job_env: complete(flow, _swap(job_env, data, flow)), flow)
+    return _started(job_id, f"swapping {amount_in} {token_in} to {token_out} in your wallet, this may take up to 30 minutes")
+
+
+@resumes("swap")
+async def _resume_swap(env: Environment, data, flow):
+    return await complete(flow, _swap(env, data, flow))
+
+
+async def _swap(env: Environment, data, flow):
+    """Runs the deposit, swap and withdraw stages of a wallet swap, skipping the ones already journaled."""
+    token_in, amount_in, token_out = flow.params["token_in"], flow.params["amount_in"], flow.params["token_out"]
+    sender = flow.params["sender"]
+    receiverId = flow.state["receiver"]
+    token_data = data.by_asset_id(flow.state["asset_id"])
+
+    if not flow.reached("deposited"):
+        deposit_flow = flow.child("deposit", {"amount": amount_in, "sender": sender, "token_symbol": token_in})
+        await _deposit_to_intents(env, data, amount_in, sender, token_in, deposit_flow)
+        if deposit_flow.finished and not deposit_flow.succeeded:
+            flow.fail("deposit did not go through")
             return False
-        
-    token_data = match[0]
-    
+        if not deposit_flow.succeeded:
+            flow.suspend("deposit still in progress")
+            return False
+        flow.record("deposited")
+
+    if not flow.reached("swapped"):
+        swap_flow = flow.child("intent_swap", {"token_in": token_in, "token_out": token_out, "amount_in": amount_in,
+                                               "contract_in": "", "contract_out": ""})
+        amount = await intent_swap(env, token_in, token_out, amount_in, data, flow=swap_flow)
+        if not amount or not swap_flow.succeeded:
+            if swap_flow.finished:
+                flow.fail("swap did not go through")
+            else:
+                flow.suspend("swap still in progress")
+            return False
+        flow.record("swapped", amount=str(amount))
+
+    amount = flow.state["amount"]
+
     if token_out.upper() == "ZEC":
-        with console.status(f"[bold green]Withdrawing {amount} {token_out}... This may take up to 15 minutes.[/bold green]"):    
-            receiverId = receiverId if receiverId else  env.env_vars.get("ZCASH_ADDRESS", None)
-            asyncio.run(zcash.withdraw(env, token_out, amount, receiverId, data))
-            return
+        withdraw_flow = flow.child("zec_withdraw", {"token": token_out, "amount": amount, "recipient": receiverId})
+    else:
+        withdraw_flow = flow.child("intents_withdraw", {"token": token_out, "amount": amount, "receiver_id": receiverId})
+    result = await _withdraw(env, token_out, amount, receiverId, token_data, withdraw_flow)
+
+    if result and withdraw_flow.succeeded:
+        flow.finish(result)
+    elif withdraw_flow.finished:
+        flow.fail("withdraw did not go through")
+    else:
+        flow.suspend("withdraw still in progress")
+    return result
+
+
+def job_status(job_id=""):
+    """Shows the progress of background deposits, swaps and withdrawals. Call this tool when the user asks about a job, a pending transaction or what is still running. Set job_id to a specific job id, or leave it empty to list every job of this session."""
+    jobs = [scheduler.get(job_id)] if job_id else list(scheduler.jobs.values())
+    jobs = [job for job in jobs if job is not None]
+
+    if not jobs:
+        env.add_reply(f"No job {job_id} found" if job_id else "No background jobs in this session")
+        return False
 
-    with console.status(f"[bold green]Withdrawing {amount} {token_out}... This may take up to 15 minutes.[/bold green]"):    
-        asyncio.run(withdraw_from_intents(env, token_out, amount, receiverId, data, token_data))
+    for job in jobs:
+        lines = [job.summary()] + [f"  {message}" for message in job.messages]
+        env.add_reply("\n".join(lines))
+    return True
 
 
 
@@ -196,6 +279,9 @@ def run(env: Environment):
 
     # return zcash.transfer(env, "u1rqpc382a2yxjmvqn68r226nhnmqwk38mz9wgg4rrm27vr8paes5jsywp8umkt8ks6huy7fcm2cc0ultx6ztu05ut5y4p20j48u3g8macdrda5gtuyurhqj9zsklc3l6fnjmcn30wk2rd0derh3zezs3quk7efe4xf0qm7da7tpg5vukhvvtfvfutkqm6dhtp9xy58su4j0djwuas63l", "0.0623", "zs1q7k4z0cyn2lah5m3l7aptrnssgg7f2dk6mjygqsh20s0mqhtjsjaq9l00w0qxj2cvfjk72yqhr4", args)
 
+    # Pick up deposits, swaps and withdrawals that an earlier process left halfway.
+    resume_all(env, data, submit=lambda flow, coro_fn: scheduler.submit_flow(env, flow, coro_fn))
+
     tool_registry = env.get_tool_registry(new=True)
     tool_registry.register_tool(deposit_to_intents)
     tool_registry.register_tool(swap_in_intents)
@@ -203,25 +289,35 @@ def run(env: Environment):
     tool_registry.register_tool(wallet_balance)
     tool_registry.register_tool(Intents_balance)
     tool_registry.register_tool(swap)
+    tool_registry.register_tool(job_status)
+    tool_registry.register_tool(token_info)
     
     user = env.env_vars.get("ACCOUNT_ID", "NEAR_ACCOUNID_NOT_IN_ENV")
     zec_addr = env.env_vars.get("ZCASH_ADDRESS", "ZCASH_ADDRESS_NOT_IN_ENV")
     
-    messages = [{"role": "system", "content": utils.main_prompt}, {"role": "user", "content": f"The thread is in terminal. My near account id is {user}. My zec address is {zec_addr}. Make sure to follow the Guidelines below {utils.main_prompt}."}] + env.list_messages()
+    messages = [{"role": "system", "content": utils.build_main_prompt(catalog.registry())}, {"role": "user", "content": f"The thread is in terminal. My near account id is {user}. My zec address is {zec_addr}. Make sure to follow the guidelines in the system prompt."}] + env.list_messages()
     
-    # asyncio.run(zcash.withdraw(env, "ZEC", "0.03", "u1pdzlp4w6rj6umsmkj5kc5te3thg3wenlnec56t7l085th7hc7degw7ysqkfr97ldwky8jlaf4zfdyd74dkl4pemdncgsn30grq925mn5y0lt6hed6kpld7pr564lxahppp6kvp5h28x0ca69cyed5x2yv9ahlx302sxav4p2cqx5zhd9d42pch9425newaaaf0hhk27gjeftxt5yyr4", data))
+    # runtime.run(zcash.withdraw(env, "ZEC", "0.03", "u1pdzlp4w6rj6umsmkj5kc5te3thg3wenlnec56t7l085th7hc7degw7ysqkfr97ldwky8jlaf4zfdyd74dkl4pemdncgsn30grq925mn5y0lt6hed6kpld7pr564lxahppp6kvp5h28x0ca69cyed5x2yv9ahlx302sxav4p2cqx5zhd9d42pch9425newaaaf0hhk27gjeftxt5yyr4", data))
 
     all_tools = env.get_tool_registry().get_all_tool_definitions()
+
+    if env.env_vars.get("STREAM_REPLIES", "1") != "0":
+        print_progress()
+        try:
+            message = stream_completion(env, messages, all_tools)
+        except Exception as e:
+            print(f"Streaming failed, waiting for the full reply instead: {e!r}")
+        else:
+            run_tool_calls(env, message)
+            (message_without_tool_call, tool_calls) = env._parse_tool_call(message)
+            if message_without_tool_call:
+                utils.print_markdown(env, message_without_tool_call)
+            return
+
     reply = env.completions_and_run_tools(messages, tools=all_tools, add_responses_to_messages=False)
     message = reply.choices[0].message
     (message_without_tool_call, tool_calls) = env._parse_tool_call(message)
     if message_without_tool_call:
-        console = Console()
-        md = Markdown(message_without_tool_call)
-
-        with StringIO() as buf:
-            console.file = buf
-            console.print(md)
-            env.add_reply(buf.getvalue())
+        utils.print_markdown(env, message_without_tool_call)
 
 run(env)
@@ -0,0 +1,72 @@
+import asyncio
+import random
+import time
+
+# Average Zcash block interval, in seconds.
+ZCASH_BLOCK_TIME = 75
+
+# Shielded proofs are built locally, so z_sendmany operations finish in
+# seconds to a minute with no block involved.
+OPERATION_POLL = dict(initial=1.0, maximum=10.0, factor=1.5)
+# Bridge bookkeeping on the relay side.
+BRIDGE_POLL = dict(initial=2.0, maximum=20.0, factor=1.5)
+# Anything that needs the transaction mined first.
+CONFIRMATION_POLL = dict(initial=5.0, maximum=ZCASH_BLOCK_TIME / 3, factor=1.5, expected=ZCASH_BLOCK_TIME)
+
+
+class Backoff:
+    """Poll delays with exponential growth and jitter.
+
+    Delays start at `initial` and grow by `factor` up to `maximum`, each
+    scaled by a random factor within +-`jitter`. When the event cannot
+    happen before roughly `expected` seconds (a block has to be mined
+    first), polling stays at `maximum` until `lead` of that time has passed
+    and then restarts from `initial`, so checks cluster around the likely
+    confirmation instead of being spread evenly.
+    """
+
+    def __init__(self, initial=1.0, maximum=30.0, factor=2.0, jitter=0.1, expected=None, lead=0.6, rng=random):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.expected = expected
+        self.lead = lead
+        self.rng = rng
+
+    def delays(self):
+        """Yields the delay before each next poll, assuming polls themselves take no time."""
+        elapsed = 0.0
+        delay = self.initial
+        quiet_until = self.expected * self.lead if self.expected else 0.0
+
+        while True:
+            if elapsed < quiet_until:
+                next_delay = min(self.maximum, quiet_until - elapsed)
+            else:
+                next_delay = delay
+                delay = min(delay * self.factor, self.maximum)
+
+            next_delay *= 1 + self.rng.uniform(-self.jitter, self.jitter)
+            elapsed += next_delay
+            yield next_delay
+
+
+async def poll(check, timeout, backoff=None, **kwargs):
+    """Awaits check() until it returns something truthy, sleeping per `backoff` in between.
+
+    Returns the truthy value, or None once `timeout` seconds have passed.
+    Keyword arguments build a Backoff when none is given.
+    """
+    backoff = backoff or Backoff(**kwargs)
+    deadline = time.monotonic() + timeout
+
+    for delay in backoff.delays():
+        result = await check()
+        if result:
+            return result
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        await asyncio.sleep(min(delay, remaining))
@@ -0,0 +1,156 @@
+import asyncio
+from decimal import Decimal
+
+from nearai.agents.environment import Environment
+
+import zcash
+from nearclient import get_near
+from runtime import get_http_client
+from tokens import catalog
+
+INTENTS_CONTRACT = "intents.near"
+NEAR_BUFFER = 25000000000000000000000
+BALANCE_CONCURRENCY = 16
+
+
+async def fetch_ft_balances(account_id):
+    """Returns {contract_id: raw balance} from fastnear."""
+    response = await get_http_client().get(f"https://api.fastnear.com/v1/account/{account_id}/ft")
+    response.raise_for_status()
+    return {token["contract_id"]: token["balance"] for token in response.json().get("tokens", [])}
+
+
+async def fetch_near_balance(account_id):
+    """Returns the raw native NEAR balance from nearblocks."""
+    response = await get_http_client().get(f"https://api.nearblocks.io/v1/account/{account_id}")
+    response.raise_for_status()
+    return response.json().get("account", [{}])[0].get("amount", "0")
+
+
+async def fetch_intents_balances(near, account_id, token_ids):
+    """Returns raw balances in intents.near, in the order of token_ids."""
+    tr = await near.view(INTENTS_CONTRACT, "mt_batch_balance_of", {"account_id": account_id, "token_ids": token_ids})
+    return tr.result
+
+
+def wallet_row(data, ft_balances, near_balance):
+    """Converts fastnear/nearblocks results to {defuse_asset_id: Decimal}.
+
+    Native NEAR is folded into wrap.near minus the NEAR_BUFFER kept for gas.
+    """
+    row = {}
+    for contract_id, raw in ft_balances.items():
+        entry = data.by_contract(contract_id)
+        if entry is None:
+            continue
+
+        raw = Decimal(raw)
+        if contract_id == "wrap.near":
+            raw = raw + Decimal(near_balance) - Decimal(NEAR_BUFFER)
+
+        row[entry["defuse_asset_id"]] = max(raw / data.scale(entry), Decimal(0))
+    return row
+
+
+async def fetch_balances(env: Environment, near_accounts=(), zcash_addresses=(), concurrency=BALANCE_CONCURRENCY, wallet=True):
+    """Balances for many NEAR accounts and Zcash addresses as an accounts x assets table.
+
+    Intents views, fastnear/nearblocks lookups and zcashd calls run
+    concurrently with at most `concurrency` requests in flight. The token
+    catalog, the NEAR client and the zcashd address listing are fetched once
+    and shared by every account; zcashd balances go out as one batch.
+
+    Returns a dict with `accounts` and `assets` (defuse asset ids) plus
+    `symbols`, and two row-per-account matrices of decimal strings: `intents`
+    (None for Zcash rows) and `wallet`. Sources that failed for an account are
+    listed under `errors` and their cells are None. With wallet=False only
+    the intents balances of the NEAR accounts are fetched.
+    """
+    data = catalog.registry()
+    assets = data.asset_ids()
+    column = {asset: i for i, asset in enumerate(assets)}
+    near_accounts = list(dict.fromkeys(near_accounts))
+    zcash_addresses = list(dict.fromkeys(zcash_addresses))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    near = get_near(env)
+    errors = {}
+
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
+
+    def to_cells(values):
+        cells = ["0"] * len(assets)
+        for asset, value in values.items():
+            if asset in column:
+                cells[column[asset]] = str(value)
+        return cells
+
+    async def near_row(account_id):
+        if not wallet:
+            try:
+                intents = await bounded(fetch_intents_balances(near, account_id, assets))
+            except Exception as e:
+                errors.setdefault(account_id, []).append(f"intents: {e}")
+                return None, None
+            return to_cells({asset: Decimal(raw) / data.scale(asset) for asset, raw in zip(assets, intents)}), None
+
+        intents, ft, native = await asyncio.gather(
+            bounded(fetch_intents_balances(near, account_id, assets)),
+            bounded(fetch_ft_balances(account_id)),
+            bounded(fetch_near_balance(account_id)),
+            return_exceptions=True,
+        )
+
+        intents_cells = None
+        if isinstance(intents, Exception):
+            errors.setdefault(account_id, []).append(f"intents: {intents}")
+        else:
+            intents_cells = to_cells({
+                asset: Decimal(raw) / data.scale(asset) for asset, raw in zip(assets, intents)
+            })
+
+        wallet_cells = None
+        for source, result in (("fastnear", ft), ("nearblocks", native)):
+            if isinstance(result, Exception):
+                errors.setdefault(account_id, []).append(f"{source}: {result}")
+        if not isinstance(ft, Exception):
+            wallet_cells = to_cells(wallet_row(data, ft, "0" if isinstance(native, Exception) else native))
+
+        return intents_cells, wallet_cells
+
+    async def zcash_rows():
+        if not zcash_addresses:
+            return []
+
+        zec = data.by_symbol_chain("ZEC", "zec")
+        try:
+            accounts = await bounded(zcash.getAccountsForAddresses(env, zcash_addresses))
+            balances = await bounded(zcash.account_balances(env, accounts.values(), data))
+        except Exception as e:
+            for address in zcash_addresses:
+                errors.setdefault(address, []).append(f"zcashd: {e}")
+            return [(None, None)] * len(zcash_addresses)
+
+        rows = []
+        for address in zcash_addresses:
+            if address not in accounts:
+                errors.setdefault(address, []).append("zcashd: address not in wallet")
+                rows.append((None, None))
+                continue
+            transparent, shielded = balances[int(accounts[address])]
+            rows.append((None, to_cells({zec["defuse_asset_id"]: Decimal(transparent) + Decimal(shielded)})))
+        return rows
+
+    *near_rows, zec_rows = await asyncio.gather(*(near_row(account_id) for account_id in near_accounts), zcash_rows())
+    rows = near_rows + zec_rows
+
+    return {
+        "accounts": near_accounts + zcash_addresses,
+        "assets": assets,
+        "symbols": [data.by_asset_id(asset)["symbol"] for asset in assets],
+        "intents": [intents for intents, _ in rows],
+        "wallet": [wallet for _, wallet in rows],
+        "errors": errors,
+    }
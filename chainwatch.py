@@ -0,0 +1,140 @@
+import asyncio
+
+# Seconds between getbestblockhash/getmempoolinfo checks without ZMQ.
+WATCH_INTERVAL = 5.0
+# With ZMQ block notifications polling is only a fallback.
+ZMQ_WATCH_INTERVAL = 30.0
+
+
+class ChainWatcher:
+    """Wakes balance waiters when zcashd sees a new block or the mempool changes.
+
+    One cheap batched getblockcount/getbestblockhash/getmempoolinfo call per
+    tick detects changes. Balances are re-read only after a change, with one
+    batched z_getbalanceforaccount call for every account someone waits on,
+    however many waiters share it. When `zmq_url` is set and pyzmq is
+    installed, zcashd's hashblock feed wakes the watcher right away.
+
+    Runs on the calling loop while there are waiters and stops after.
+    """
+
+    def __init__(self, rpc, parse_balance, interval=WATCH_INTERVAL, zmq_url=None):
+        self.rpc = rpc
+        self.parse_balance = parse_balance
+        self.interval = interval
+        self.zmq_url = zmq_url
+        self.block_count = None
+        self.best_hash = None
+        self.mempool_size = None
+        self.changes = 0
+        self.balance_queries = 0
+        self._balance_waiters = {}
+        self._refresh = False
+        self._wakeup = None
+        self._task = None
+        self._zmq_task = None
+
+    async def wait_for_balance(self, account, predicate, timeout):
+        """Waits until predicate(transparent, shielded) holds for the account.
+
+        Returns the (transparent, shielded) balances that satisfied it, or
+        None after `timeout` seconds.
+        """
+        waiter = (predicate, asyncio.get_running_loop().create_future())
+        waiters = self._balance_waiters.setdefault(int(account), [])
+        waiters.append(waiter)
+        try:
+            return await self._wait(waiter[1], timeout)
+        finally:
+            waiters.remove(waiter)
+            if not waiters:
+                self._balance_waiters.pop(int(account), None)
+
+    async def _wait(self, future, timeout):
+        # A new waiter gets a first answer without waiting for a change.
+        self._refresh = True
+        self._start()
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def _start(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if self.zmq_url and (self._zmq_task is None or self._zmq_task.done()):
+            self._zmq_task = asyncio.get_running_loop().create_task(self._listen_zmq())
+
+    def _has_waiters(self):
+        return bool(self._balance_waiters)
+
+    async def _tick(self):
+        """Returns (new_block, mempool_changed) since the previous tick."""
+        count, best, mempool = await self.rpc.batch([("getblockcount", []), ("getbestblockhash", []), ("getmempoolinfo", [])])
+        new_block = best["result"] is not None and best["result"] != self.best_hash
+        size = (mempool["result"] or {}).get("size")
+        mempool_changed = size != self.mempool_size
+
+        if new_block:
+            self.block_count, self.best_hash = count["result"], best["result"]
+        self.mempool_size = size
+        return new_block, mempool_changed
+
+    async def _notify_balances(self):
+        accounts = list(self._balance_waiters)
+        if not accounts:
+            return
+
+        self.balance_queries += 1
+        responses = await self.rpc.batch([("z_getbalanceforaccount", [account]) for account in accounts])
+        for account, response in zip(accounts, responses):
+            if response.get("result") is None:
+                continue
+            transparent, shielded = self.parse_balance(response)
+            for predicate, future in list(self._balance_waiters.get(account, [])):
+                if not future.done() and predicate(transparent, shielded):
+                    future.set_result((transparent, shielded))
+
+    async def _run(self):
+        while self._has_waiters():
+            try:
+                new_block, mempool_changed = await self._tick()
+                refresh, self._refresh = self._refresh, False
+
+                if new_block or mempool_changed or refresh:
+                    self.changes += 1
+                    await self._notify_balances()
+            except Exception as e:
+                print(f"Chain watcher tick failed: {e!r}")
+
+            self._wakeup.clear()
+            interval = ZMQ_WATCH_INTERVAL if self._zmq_task is not None and not self._zmq_task.done() else self.interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _listen_zmq(self):
+        try:
+            import zmq
+            import zmq.asyncio
+        except ImportError:
+            print("pyzmq is not installed; falling back to polling for new blocks")
+            return
+
+        socket = zmq.asyncio.Context.instance().socket(zmq.SUB)
+        socket.connect(self.zmq_url)
+        socket.setsockopt(zmq.SUBSCRIBE, b"hashblock")
+        try:
+            while self._has_waiters():
+                try:
+                    await asyncio.wait_for(socket.recv_multipart(), ZMQ_WATCH_INTERVAL)
+                except asyncio.TimeoutError:
+                    continue
+                self._wakeup.set()
+        finally:
+            socket.close(linger=0)
@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+from nearai.agents.environment import Environment
+
+from intents.utils import build_intent_message, generate_nonce, base64_to_uint8array, serialize_intent, intent_deadline, \
+    swap_intent, withdraw_intent
+from intents.quote import quote_expires_at
+from intents.settlement import settlement_tracker, settled_hash
+from intents.signer import get_signer, ensure_public_key, invalidate_public_key
+from progress import emit
+from runtime import get_http_client
+
+INTENTS_CONTRACT = "intents.near"
+url = "https://solver-relay-v2.chaindefuser.com/rpc"
+
+headers = {
+    "Content-Type": "application/json"
+}
+
+# Longest deadline given to a batch that carries no quotes, in seconds.
+BATCH_DEADLINE = 180
+
+
+class IntentBatch:
+    """Collects swap and withdraw intents and publishes them in one relay call.
+
+    By default every intent goes into a single NEP-413 payload, so the
+    contract executes them in order and all-or-nothing; `publish(combined=False)`
+    signs one payload per intent and sends them together with publish_intents.
+    Either way the quote hashes of every swap go in the same request and
+    settlement is awaited once for the whole batch.
+
+    `relay_url` and `tracker` can point at a local relay stub.
+    """
+
+    def __init__(self, env: Environment, relay_url=url, tracker=settlement_tracker):
+        self.env = env
+        self.relay_url = relay_url
+        self.tracker = tracker
+        self.signer = get_signer(env)
+        self.intents = []
+        self.quote_hashes = []
+        self._deadline = time.time() + BATCH_DEADLINE
+
+    def __len__(self):
+        return len(self.intents)
+
+    def add_intent(self, intent, quote=None):
+        self.intents.append(intent)
+        if quote is not None:
+            self.quote_hashes.append(quote["quote_hash"])
+            self._deadline = min(self._deadline, quote_expires_at(quote))
+        return self
+
+    def add_swap(self, quote):
+        """Adds the token_diff matching a relay quote."""
+        intent = swap_intent(quote["defuse_asset_identifier_in"], quote["amount_in"],
+                             quote["defuse_asset_identifier_out"], quote["amount_out"])
+        return self.add_intent(intent, quote)
+
+    async def add_withdraw(self, token, receiver_id, amount, blockchain):
+        return self.add_intent(await withdraw_intent(self.env, token, receiver_id, amount, blockchain))
+
+    def deadline(self):
+        return intent_deadline(self._deadline - time.time())
+
+    def _signed_data(self, intents, deadline):
+        message_str = build_intent_message(self.signer.account_id, intents, deadline)
+        nonce = generate_nonce()
+        quote_hash_solver = serialize_intent(message_str, INTENTS_CONTRACT, base64_to_uint8array(nonce))
+
+        return {
+            "payload": {
+                "message": message_str,
+                "nonce": nonce,
+                "recipient": INTENTS_CONTRACT,
+            },
+            "standard": "nep413",
+            "signature": self.signer.sign(quote_hash_solver),
+            "public_key": self.signer.public_key,
+        }
+
+    def build_request(self, combined=True):
+        deadline = self.deadline()
+
+        if combined:
+            return {
+                "id": 1,
+                "jsonrpc": "2.0",
+                "method": "publish_intent",
+                "params": [
+                    {
+                        "quote_hashes": self.quote_hashes,
+                        "signed_data": self._signed_data(self.intents, deadline),
+                    }
+                ]
+            }
+
+        return {
+            "id": 1,
+            "jsonrpc": "2.0",
+            "method": "publish_intents",
+            "params": [
+                {
+                    "quote_hashes": self.quote_hashes,
+                    "signed_datas": [self._signed_data([intent], deadline) for intent in self.intents],
+                }
+            ]
+        }
+
+    async def publish(self, combined=True):
+        """Signs and publishes the batch, then waits for it to settle.
+
+        Returns (settled, results) where results holds the settlement
+        response of every published intent hash, or the relay response when
+        publishing failed.
+        """
+        if not self.intents:
+            return True, []
+
+        await ensure_public_key(self.env, self.signer)
+
+        response = await get_http_client().post(self.relay_url, headers=headers, json=self.build_request(combined))
+        response.raise_for_status()
+        resp = response.json()
+
+        if resp.get("result", {}).get("status") != "OK":
+            invalidate_public_key(self.signer.account_id, self.signer.public_key)
+            return False, [resp]
+
+        result = resp["result"]
+        intent_hashes = result["intent_hashes"] if "intent_hashes" in result else [result["intent_hash"]]
+        for intent_hash in intent_hashes:
+            emit("published", intent_hash=intent_hash)
+        outcomes = await asyncio.gather(*(self.tracker.wait(intent_hash) for intent_hash in intent_hashes))
+        for intent_hash, (settled, status) in zip(intent_hashes, outcomes):
+            emit("settled", intent_hash=intent_hash, settled=settled, tx_hash=settled_hash(status))
+
+        return all(settled for settled, _ in outcomes), [result for _, result in outcomes]
@@ -0,0 +1,88 @@
+import asyncio
+from decimal import Decimal
+
+from nearai.agents.environment import Environment
+
+from intents.batch import IntentBatch
+from intents.quote import get_quote
+from nearclient import get_near
+
+INTENTS_CONTRACT = "intents.near"
+
+
+def plan_consolidation(target_balance, sources, amount):
+    """Picks the fewest sources whose balances cover `amount`.
+
+    `sources` is a list of (token, balance) in human units. Tokens sharing a
+    symbol are treated as worth the same, so taking the largest balances
+    first gives the minimal set. Returns an empty plan when the target
+    already holds enough, and every non-empty source when even all of them
+    together fall short.
+    """
+    missing = Decimal(amount) - target_balance
+    plan = []
+
+    for token, balance in sorted(sources, key=lambda source: source[1], reverse=True):
+        if missing <= 0 or balance <= 0:
+            break
+        plan.append((token, balance))
+        missing -= balance
+
+    return plan
+
+
+async def consolidate(env: Environment, data, token, amount):
+    """Moves enough of `token`'s sibling contracts into it to cover `amount`.
+
+    Balances of every contract sharing the symbol are read in one view, the
+    planned sources are quoted in parallel, and all swaps are published as
+    one batch with a single settlement wait. Returns the resulting balance
+    of `token` in human units.
+    """
+    user_account_id = env.env_vars.get("ACCOUNT_ID")
+    near = get_near(env)
+
+    token_list = data.by_symbol(token["symbol"])
+    if len(token_list) < 2:
+        return None
+
+    contract_list = [obj["defuse_asset_id"] for obj in token_list]
+    tr = await near.view(INTENTS_CONTRACT, "mt_batch_balance_of",
+                         {
+                             "account_id": user_account_id,
+                             "token_ids": contract_list,
+                         })
+    raw = dict(zip(contract_list, tr.result))
+    target_balance = Decimal(raw[token["defuse_asset_id"]]) / data.scale(token)
+
+    sources = [(obj, Decimal(raw[obj["defuse_asset_id"]]) / data.scale(obj))
+               for obj in token_list if obj["defuse_asset_id"] != token["defuse_asset_id"]]
+    plan = plan_consolidation(target_balance, sources, amount)
+    if not plan:
+        return target_balance
+
+    quotes = await asyncio.gather(*(
+        get_quote(env, obj["defuse_asset_id"], token["defuse_asset_id"], int(raw[obj["defuse_asset_id"]]))
+        for obj, _ in plan
+    ))
+
+    batch = IntentBatch(env)
+    for (obj, _), quote in zip(plan, quotes):
+        if quote is None:
+            env.add_reply(f"Error: no valid quote to move {obj['symbol']} from {obj['defuse_asset_id']}")
+            continue
+        batch.add_swap(quote)
+
+    if not len(batch):
+        return target_balance
+
+    settled, results = await batch.publish()
+    if not settled:
+        env.add_reply("Error: consolidation swaps did not settle")
+        return target_balance
+
+    for result in results:
+        env.add_reply(f"Transaction Hash: {result['result']['data']['hash']}")
+
+    received = sum(Decimal(quote["amount_out"]) for quote in quotes if quote is not None)
+    return target_balance + received / data.scale(token)
@@ -1,18 +1,18 @@
 import json
 from decimal import Decimal
 
-import requests
 from nearai.agents.environment import Environment
 
 import zcash
+from journal import get_journal, complete, resumes
+from nearclient import get_near
+from progress import emit
+from runtime import get_http_client
 
 default_mainnet_rpc = "https://rpc.mainnet.near.org"
 
 import re
 
-with open("tokens.json", "r") as file:
-    data = json.load(file)
-
 INTENTS_CONTRACT = "intents.near"
 url = "https://solver-relay-v2.chaindefuser.com/rpc"
 
@@ -27,12 +27,23 @@ FT_TRANSFER_GAS = 50000000000000
 FT_MINIMUM_STORAGE_BALANCE_LARGE = 1250000000000000000000
 
 
-async def _deposit_to_intents(env: Environment, data, amount, sender, token_symbol = ""):
+async def _deposit_to_intents(env: Environment, data, amount, sender, token_symbol = "", flow=None):
+    flow = flow or get_journal().start("deposit", {"amount": str(amount), "sender": sender, "token_symbol": token_symbol})
+    if flow.finished:
+        return flow.state.get("result")
+    return await complete(flow, _deposit(env, data, amount, sender, token_symbol, flow))
+
+
+@resumes("deposit")
+async def _resume_deposit(env: Environment, data, flow):
+    params = flow.params
+    return await _deposit_to_intents(env, data, params["amount"], params["sender"], params["token_symbol"], flow)
+
+
+async def _deposit(env: Environment, data, amount, sender, token_symbol, flow):
     
-    supported_data = data
     user_account_id = env.env_vars.get("ACCOUNT_ID")
-    user_private_key = env.env_vars.get("PRIVATE_KEY")
-    matches = [obj for obj in supported_data if obj["symbol"] == token_symbol.upper() and obj["blockchain"] in ("near", "zec")]
+    matches = data.by_symbol_chains(token_symbol, ("near", "zec"))
     
     if not matches:
       env.add_reply(f"Token {token_symbol} may not be supported. Please confirm your token again.")
@@ -40,14 +51,20 @@ async def _deposit_to_intents(env: Environment, data, amount, sender, token_symb
   
     token = matches[0]
     if token["symbol"] == "ZEC":
-        txid = await zcash.deposit(env, sender, amount)
-        return True
+        txid = await zcash.deposit(env, sender, amount, data, flow.child("zec_deposit", {"sender": sender, "amount": str(amount)}))
+        return bool(txid)
+
+    if flow.reached("sending"):
+        # NEAR transactions carry no id we could look up again, so do not send twice.
+        env.add_reply(f"The process stopped while depositing {amount} {token_symbol}. Please check your Intents balance before retrying.")
+        return False
     
-    amount = Decimal(amount) * Decimal(10) ** int(token["decimals"])
+    amount = Decimal(amount) * data.scale(token)
     amount = int(amount) 
     contract_id = token["defuse_asset_id"].replace("nep141:", "")
 
-    near = env.set_near(user_account_id, user_private_key)
+    near = get_near(env)
+    flow.record("sending")
 
     nep141balance = await near.view(
         contract_id="wrap.near",
@@ -66,7 +83,7 @@ async def _deposit_to_intents(env: Environment, data, amount, sender, token_symb
 
     if contract_id == "wrap.near":
 
-        token_response = requests.get(f"https://api.fastnear.com/v1/account/{user_account_id}/ft")
+        token_response = await get_http_client().get(f"https://api.fastnear.com/v1/account/{user_account_id}/ft")
         token_response.raise_for_status()
 
         tokens = token_response.json().get("tokens", [])
@@ -107,6 +124,7 @@ async def _deposit_to_intents(env: Environment, data, amount, sender, token_symb
       if "SuccessValue" not in tr.status:
             return False
 
-    amount = float(amount) / float(Decimal(10) ** int(token["decimals"]))
+    amount = float(amount) / float(data.scale(token))
+    emit("txid", chain="near", txid=tr.transaction.hash)
     env.add_reply(f"Transaction Hash: {tr.transaction.hash}")
-    return True
+    return tr.transaction.hash
@@ -0,0 +1,200 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from nearai.agents.environment import Environment
+
+from progress import emit
+from runtime import get_http_client
+
+url = "https://solver-relay-v2.chaindefuser.com/rpc"
+
+headers = {
+    "Content-Type": "application/json"
+}
+
+# Hard latency budget for one quote round, in seconds.
+QUOTE_BUDGET = 3.0
+# Delay before re-asking a source that answered with no quotes.
+QUOTE_RETRY_DELAY = 0.25
+# Quotes expiring sooner than this are not worth signing.
+QUOTE_MIN_VALIDITY = 5
+QUOTE_CACHE_SIZE = 128
+# Amounts sharing this many leading digits share a cache bucket.
+QUOTE_BUCKET_DIGITS = 3
+
+
+def quote_sources(env: Environment):
+    """The solver relay plus any extra endpoints listed in SOLVER_RELAY_URLS (comma separated)."""
+    extra = env.env_vars.get("SOLVER_RELAY_URLS", "") or ""
+    sources = [url]
+    for source in extra.split(","):
+        source = source.strip()
+        if source and source not in sources:
+            sources.append(source)
+    return sources
+
+
+def quote_expires_at(quote):
+    """Returns the quote's expiration_time as a unix timestamp."""
+    expiration = quote["expiration_time"].replace("Z", "+00:00")
+    return datetime.fromisoformat(expiration).timestamp()
+
+
+def is_quote_valid(quote, min_validity=QUOTE_MIN_VALIDITY):
+    try:
+        return quote_expires_at(quote) - time.time() > min_validity
+    except (KeyError, ValueError):
+        return False
+
+
+async def _ask_source(source, asset_in, asset_out, amount, deadline):
+    data = {
+        "id": 1,
+        "jsonrpc": "2.0",
+        "method": "quote",
+        "params": [
+            {
+                "defuse_asset_identifier_in": asset_in,
+                "defuse_asset_identifier_out": asset_out,
+                "exact_amount_in": str(amount)
+            }
+        ]
+    }
+
+    while True:
+        try:
+            response = await get_http_client().post(source, headers=headers, json=data)
+            response.raise_for_status()
+            result = response.json().get("result")
+            if result:
+                return result
+        except Exception as err:
+            print(f"Quote request to {source} failed: {err}")
+
+        if time.monotonic() + QUOTE_RETRY_DELAY >= deadline:
+            return []
+        await asyncio.sleep(QUOTE_RETRY_DELAY)
+
+
+async def stream_quotes(sources, asset_in, asset_out, amount, budget=QUOTE_BUDGET, received=None):
+    """Yields the best valid quote every time it improves.
+
+    All sources are asked in parallel. The stream ends when every source has
+    answered or the budget runs out, whichever comes first. Every valid
+    quote, best or not, is appended to `received` when it is given.
+    """
+    deadline = time.monotonic() + budget
+    tasks = {asyncio.ensure_future(_ask_source(source, asset_in, asset_out, amount, deadline)) for source in sources}
+    best = None
+
+    try:
+        while tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            done, tasks = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for quote in task.result():
+                    if not is_quote_valid(quote):
+                        continue
+                    if received is not None:
+                        received.append(quote)
+                    if best is None or int(quote["amount_out"]) > int(best["amount_out"]):
+                        best = quote
+                        yield best
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def best_quote(env: Environment, asset_in, asset_out, amount, budget=QUOTE_BUDGET, received=None):
+    """Returns the quote with the highest amount_out received within the budget, or None."""
+    best = None
+    async for quote in stream_quotes(quote_sources(env), asset_in, asset_out, amount, budget, received):
+        best = quote
+    return best
+
+
+class QuoteCache:
+    """Unused quotes of earlier rounds, keyed by (asset_in, asset_out, amount bucket).
+
+    A round returns the best quote to its caller and leaves the other
+    solvers' quotes here. Each is a separate firm offer, so the next request
+    for the same pair and a similar amount can be served one right away. A
+    quote is handed out once and only while it is still valid and its
+    amount_in does not exceed the requested amount. Entries are evicted on
+    expiry and in LRU order once the cache is full.
+    """
+
+    def __init__(self, max_entries=QUOTE_CACHE_SIZE, bucket_digits=QUOTE_BUCKET_DIGITS):
+        self.max_entries = max_entries
+        self.bucket_digits = bucket_digits
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def _key(self, asset_in, asset_out, amount):
+        amount = int(amount)
+        scale = 10 ** max(len(str(amount)) - self.bucket_digits, 0)
+        return asset_in, asset_out, amount // scale * scale
+
+    def take(self, asset_in, asset_out, amount):
+        """Removes and returns the best usable quote for the request, or None."""
+        key = self._key(asset_in, asset_out, amount)
+        quotes = [quote for quote in self._entries.get(key, []) if is_quote_valid(quote)]
+
+        usable = [quote for quote in quotes if int(quote["amount_in"]) <= int(amount)]
+        if not usable:
+            self.misses += 1
+            if quotes:
+                self._entries[key] = quotes
+            else:
+                self._entries.pop(key, None)
+            return None
+
+        best = max(usable, key=lambda quote: int(quote["amount_out"]))
+        quotes.remove(best)
+        if quotes:
+            self._entries[key] = quotes
+            self._entries.move_to_end(key)
+        else:
+            del self._entries[key]
+        self.hits += 1
+        return best
+
+    def put(self, asset_in, asset_out, amount, quotes):
+        key = self._key(asset_in, asset_out, amount)
+        # Mirrored relays return the same solver quote more than once.
+        merged = {quote["quote_hash"]: quote for quote in self._entries.get(key, []) + list(quotes)}
+        self._entries[key] = list(merged.values())
+        self._entries.move_to_end(key)
+
+        for stale in [k for k, entries in self._entries.items() if not any(is_quote_valid(q) for q in entries)]:
+            del self._entries[stale]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": sum(len(quotes) for quotes in self._entries.values())}
+
+
+quote_cache = QuoteCache()
+
+
+async def get_quote(env: Environment, asset_in, asset_out, amount):
+    """Returns a cached quote for the pair and amount, or the best of a fresh round.
+
+    The quote returned is never handed out again; the rest of a fresh
+    round's quotes are kept in quote_cache for the next request.
+    """
+    quote = quote_cache.take(asset_in, asset_out, amount)
+    if quote is None:
+        received = []
+        quote = await best_quote(env, asset_in, asset_out, amount, received=received)
+        quote_cache.put(asset_in, asset_out, amount, [other for other in received if quote is None or other["quote_hash"] != quote["quote_hash"]])
+    if quote is not None:
+        emit("quote", asset_in=asset_in, asset_out=asset_out, amount_in=quote.get("amount_in", amount), amount_out=quote["amount_out"])
+    return quote
@@ -0,0 +1,202 @@
+import asyncio
+import time
+
+from progress import emit
+from runtime import get_http_client
+
+url = "https://solver-relay-v2.chaindefuser.com/rpc"
+
+headers = {
+    "Content-Type": "application/json"
+}
+
+FAILED_STATUSES = ("NOT_FOUND_OR_NOT_VALID_ANYMORE", "NOT_FOUND_OR_NOT_VALID", "FAILED")
+
+
+class _PendingIntent:
+    def __init__(self, future, deadline, interval):
+        self.future = future
+        self.deadline = deadline
+        self.interval = interval
+        self.next_poll = time.monotonic() + interval
+        self.status = None
+        self.response = None
+
+
+class IntentSettlementTracker:
+    """Tracks many published intents and resolves one future per intent.
+
+    A single poller task checks every intent that is due in the same tick.
+    Each intent starts at `min_interval` and backs off by `backoff` up to
+    `max_interval` while its status is unchanged; a status change resets it.
+    Futures resolve to `(settled, response)` like the old busy-polling helper.
+    """
+
+    def __init__(self, relay_url=url, timeout=30, min_interval=0.2, max_interval=2.0, backoff=1.5):
+        self.relay_url = relay_url
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.requests_sent = 0
+        self._pending = {}
+        self._wakeup = None
+        self._task = None
+
+    def track(self, intent_hash, timeout=None):
+        """Starts tracking an intent and returns the future for its outcome."""
+        if intent_hash in self._pending:
+            return self._pending[intent_hash].future
+
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self._pending[intent_hash] = _PendingIntent(loop.create_future(), deadline, self.min_interval)
+
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+        return self._pending[intent_hash].future
+
+    async def wait(self, intent_hash, timeout=None):
+        return await asyncio.shield(self.track(intent_hash, timeout))
+
+    async def _get_status(self, intent_hash):
+        self.requests_sent += 1
+        data = {
+            "id": 1,
+            "jsonrpc": "2.0",
+            "method": "get_status",
+            "params": [
+                {
+                    "intent_hash": intent_hash
+                }
+            ]
+        }
+        response = await get_http_client().post(self.relay_url, headers=headers, json=data)
+        response.raise_for_status()
+        return response.json()
+
+    def _resolve(self, intent_hash, settled, resp):
+        pending = self._pending.pop(intent_hash)
+        if not pending.future.done():
+            pending.future.set_result((settled, resp))
+
+    async def _run(self):
+        while self._pending:
+            now = time.monotonic()
+            delay = min(p.next_poll for p in self._pending.values()) - now
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+
+            now = time.monotonic()
+            due = [h for h, p in self._pending.items() if p.next_poll <= now]
+            responses = await asyncio.gather(*(self._get_status(h) for h in due), return_exceptions=True)
+
+            now = time.monotonic()
+            for intent_hash, resp in zip(due, responses):
+                pending = self._pending.get(intent_hash)
+                if pending is None:
+                    continue
+
+                try:
+                    self._handle(intent_hash, pending, resp, now)
+                except Exception as e:
+                    # One bad reply fails its own intent, never the poller.
+                    print(f"Settlement check for {intent_hash} failed: {e!r}")
+                    self._pending.pop(intent_hash, None)
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+
+    def _handle(self, intent_hash, pending, resp, now):
+        status = None
+        if not isinstance(resp, Exception):
+            # JSON-RPC errors and replies without a result are retried like transport errors.
+            result = resp.get("result") if isinstance(resp, dict) else None
+            status = result.get("status") if isinstance(result, dict) else None
+            if status is None:
+                print(f"Unexpected get_status reply for {intent_hash}: {resp}")
+
+        if status is not None:
+            pending.response = resp
+
+            if status == "SETTLED":
+                self._resolve(intent_hash, True, resp)
+                return
+
+            if status in FAILED_STATUSES:
+                if status != "FAILED":
+                    print("Intent not found or not valid anymore")
+                self._resolve(intent_hash, False, resp)
+                return
+
+            if status != pending.status:
+                pending.status = status
+                pending.interval = self.min_interval
+            else:
+                pending.interval = min(pending.interval * self.backoff, self.max_interval)
+        else:
+            pending.interval = min(pending.interval * self.backoff, self.max_interval)
+
+        if now > pending.deadline:
+            print(f"Timeout: Operation took longer than {self.timeout} seconds")
+            self._resolve(intent_hash, False, pending.response)
+            return
+
+        pending.next_poll = now + pending.interval
+
+settlement_tracker = IntentSettlementTracker()
+
+
+def settled_hash(result):
+    """The NEAR transaction hash in a get_status response, or None."""
+    return (((result or {}).get("result") or {}).get("data") or {}).get("hash")
+
+
+async def publish_and_wait(request, flow=None, relay_url=url):
+    """Publishes a signed intent request and waits for it to settle.
+
+    With a journal `flow` the signed request is recorded before it is sent
+    and the intent hash once the relay accepts it, so a resumed flow either
+    re-sends the same signed request (its nonce keeps it from executing
+    twice) or just waits for the recorded hash. A wait that ends without a
+    final status suspends the flow instead of failing it.
+
+    Returns (publish response, settled, intent_hash, settlement response).
+    """
+    if flow is not None and flow.reached("published"):
+        resp, intent_hash = flow.state["publish_response"], flow.state["intent_hash"]
+    else:
+        if flow is not None:
+            flow.record("publishing", request=request)
+
+        response = await get_http_client().post(relay_url, headers=headers, json=request)
+        response.raise_for_status()
+        resp = response.json()
+
+        if resp["result"]["status"] != "OK":
+            return resp, False, None, resp
+
+        intent_hash = resp["result"]["intent_hash"]
+        if flow is not None:
+            flow.record("published", intent_hash=intent_hash, publish_response=resp)
+        emit("published", intent_hash=intent_hash)
+
+    settled, result = await settlement_tracker.wait(intent_hash)
+    emit("settled", intent_hash=intent_hash, settled=settled, tx_hash=settled_hash(result))
+
+    if settled and flow is not None:
+        flow.record("settled")
+    elif flow is not None:
+        status = ((result or {}).get("result") or {}).get("status")
+        if status not in FAILED_STATUSES:
+            flow.suspend(f"intent {intent_hash} not settled yet")
+
+    return resp, settled, intent_hash, result
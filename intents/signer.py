@@ -0,0 +1,60 @@
+from nearai.agents.environment import Environment
+
+from intents.utils import add_public_key
+
+ED_PREFIX = "ed25519:"
+
+
+class IntentSigner:
+    """NEP-413 signing key for one account, derived from PRIVATE_KEY once."""
+
+    def __init__(self, account_id, private_key):
+        # Crypto modules load with the first signer rather than at import.
+        import base58
+        import nacl.signing
+
+        private_key_bytes = base58.b58decode(private_key[len(ED_PREFIX):])
+
+        if len(private_key_bytes) != 64:
+            raise ValueError("The private key must be exactly 64 bytes long")
+
+        self.account_id = account_id
+        self._signing_key = nacl.signing.SigningKey(private_key_bytes[:32])
+        self.public_key = ED_PREFIX + base58.b58encode(self._signing_key.verify_key.encode()).decode("utf-8")
+
+    def sign(self, message_hash):
+        """Signs a serialized intent hash and returns the "ed25519:..." signature."""
+        import base58
+
+        signed = self._signing_key.sign(message_hash)
+        return ED_PREFIX + base58.b58encode(signed.signature).decode("utf-8")
+
+
+_signers = {}
+# (account_id, public_key) pairs known to be registered on intents.near.
+_registered_keys = set()
+
+
+def get_signer(env: Environment):
+    """Returns the cached signer for ACCOUNT_ID / PRIVATE_KEY."""
+    key = (env.env_vars.get("ACCOUNT_ID"), env.env_vars.get("PRIVATE_KEY"))
+    signer = _signers.get(key)
+    if signer is None:
+        signer = _signers[key] = IntentSigner(*key)
+    return signer
+
+
+async def ensure_public_key(env: Environment, signer: IntentSigner):
+    """Registers the signer's key on intents.near unless it is already known to be there."""
+    key = (signer.account_id, signer.public_key)
+    if key in _registered_keys:
+        return
+
+    await add_public_key(env, signer.public_key)
+    _registered_keys.add(key)
+
+
+def invalidate_public_key(account_id, public_key=None):
+    """Forgets the registration state so the next intent checks intents.near again."""
+    for key in [k for k in _registered_keys if k[0] == account_id and public_key in (None, k[1])]:
+        _registered_keys.discard(key)
@@ -2,22 +2,18 @@ import json
 import time
 from decimal import Decimal
 
-import requests
 from nearai.agents.environment import Environment
 
 import base64
-import requests
 import hashlib
 import secrets
+import struct
 from typing import Any, List, Optional, Union
 from serializer import BinarySerializer
-from borsh_construct import U32
+from nearclient import get_near
 
 default_mainnet_rpc = "https://rpc.mainnet.near.org"
 
-with open("tokens.json", "r") as file:
-    data = json.load(file)
-
 INTENTS_CONTRACT = "intents.near"
 url = "https://solver-relay-v2.chaindefuser.com/rpc"
 
@@ -35,8 +31,7 @@ FT_MINIMUM_STORAGE_BALANCE_LARGE = 1250000000000000000000
 async def add_public_key(env: Environment, public_key):
     # Setup
     user_account_id = env.env_vars.get("ACCOUNT_ID")
-    user_private_key = env.env_vars.get("PRIVATE_KEY")
-    near = env.set_near(user_account_id, user_private_key)
+    near = get_near(env)
 
     has_public_key = await near.view(
         "intents.near",
@@ -47,7 +42,7 @@ async def add_public_key(env: Environment, public_key):
         }
     )
 
-    if has_public_key:
+    if has_public_key.result:
         return
 
     # Add the public_key
@@ -60,54 +55,35 @@ async def add_public_key(env: Environment, public_key):
     )
 
 
-def get_intent_settled_status(intent_hash):
-    data = {
-        "id": 1,
-        "jsonrpc": "2.0",
-        "method": "get_status",
-        "params": [
-            {
-                "intent_hash": intent_hash
-            }
-        ]
-    }
-
-    start_time = time.time()
-    status = "GOOD"
-    while True:
-        time.sleep(0.2)
-
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-        response.raise_for_status()
-        resp = response.json()
+def intent_deadline(seconds=180):
+    # now + 3 min in a format of 2025-01-21T14:55:40.323Z
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(time.time() + seconds))
 
-        if resp['result']['status'] == "SETTLED":
-            return True, resp
 
-        elif (resp['result']['status'] == "NOT_FOUND_OR_NOT_VALID_ANYMORE"
-            or resp['result']['status'] == "NOT_FOUND_OR_NOT_VALID"):
-            print("Intent not found or not valid anymore")
-            return False, resp
-        
-        elif resp['result']['status'] == "FAILED":
-            return False, resp
+def build_intent_message(signer_id, intents, deadline=None):
+    """JSON message for one NEP-413 payload carrying all `intents`, executed in order."""
+    message = {
+        "signer_id": signer_id,
+        "deadline": deadline or intent_deadline(),
+        "intents": list(intents),
+    }
+    return json.dumps(message)
 
-        elif time.time() - start_time > 30:
-            print("Timeout: Operation took longer than 30 seconds")
-            return False, resp
 
-        if status != resp['result']['status']:
-            status = resp['result']['status']
-        
+def swap_intent(token_in, amount_in, token_out, amount_out):
+    return {
+        "intent": "token_diff",
+        "diff": {
+            f"{token_in}": f"-{amount_in}",
+            f"{token_out}": amount_out
+        }
+    }
 
 
-async def get_withdraw_message_to_sign(env: Environment, signer_id, token, receiver_id, amount, blockchain):
-    # now + 3 min in a format of 2025-01-21T14:55:40.323Z
-    exp_time = (time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(time.time() + 180)))
+async def withdraw_intent(env: Environment, token, receiver_id, amount, blockchain):
     user_account_id = env.env_vars.get("ACCOUNT_ID")
-    user_private_key = env.env_vars.get("PRIVATE_KEY")
 
-    near = env.set_near(user_account_id, user_private_key)
+    near = get_near(env)
 
     nep141balance = await near.view(
         contract_id="wrap.near",
@@ -124,73 +100,38 @@ async def get_withdraw_message_to_sign(env: Environment, signer_id, token, recei
 
     storage_deposit = 0 if nep141balance > FT_MINIMUM_STORAGE_BALANCE_LARGE else FT_MINIMUM_STORAGE_BALANCE_LARGE
 
-    message = "dummy"
-
     if token == "wrap.near":
-        message = {
-            "signer_id": signer_id,
-            "deadline": exp_time,
-            "intents": [
-                {
-                    "intent": "native_withdraw" ,
-                    "receiver_id": receiver_id,
-                    "amount": str(amount)
-                }
-            ]
+        return {
+            "intent": "native_withdraw" ,
+            "receiver_id": receiver_id,
+            "amount": str(amount)
         }
     elif blockchain == "near":
-        message = {
-            "signer_id": signer_id,
-            "deadline": exp_time,
-            "intents": [
-                {
-                    "intent": "ft_withdraw" ,
-                    "receiver_id": receiver_id,
-                    "token": token,
-                    "amount": str(amount),
-                    "deposit": str(storage_deposit)
-                }
-            ]
+        return {
+            "intent": "ft_withdraw" ,
+            "receiver_id": receiver_id,
+            "token": token,
+            "amount": str(amount),
+            "deposit": str(storage_deposit)
         }
     else:
-        message = {
-            "signer_id": signer_id,
-            "deadline": exp_time,
-            "intents": [
-                {
-                    "intent": "ft_withdraw",
-                    "receiver_id": token,
-                    "amount": str(amount),
-                    "token": token,
-                    "deposit": str(storage_deposit),
-                    "memo": f"WITHDRAW_TO:{receiver_id}"
-                }
-            ]
+        return {
+            "intent": "ft_withdraw",
+            "receiver_id": token,
+            "amount": str(amount),
+            "token": token,
+            "deposit": str(storage_deposit),
+            "memo": f"WITHDRAW_TO:{receiver_id}"
         }
-    
-    # Convert message dictionary to JSON string
-    message_str = json.dumps(message)
-    return message_str
 
 
-def get_swap_message_to_sign(signer_id, token_in, amount_in, token_out, amount_out, exp_time):
-    # Construct the message dictionary
-    message = {
-        "signer_id": signer_id,
-        "deadline": exp_time,
-        "intents": [
-            {
-                "intent": "token_diff",
-                "diff": {
-                    f"{token_in}": f"-{amount_in}",
-                    f"{token_out}": amount_out
-                }
-            }
-        ]
-    }
+async def get_withdraw_message_to_sign(env: Environment, signer_id, token, receiver_id, amount, blockchain):
+    intent = await withdraw_intent(env, token, receiver_id, amount, blockchain)
+    return build_intent_message(signer_id, [intent])
+
 
-    message_str = json.dumps(message)
-    return message_str
+def get_swap_message_to_sign(signer_id, token_in, amount_in, token_out, amount_out, exp_time):
+    return build_intent_message(signer_id, [swap_intent(token_in, amount_in, token_out, amount_out)], exp_time)
 
 
 def generate_nonce():
@@ -257,12 +198,15 @@ PAYLOAD_SCHEMA: list[list[Any]] = [
     ]
 ]
 
+PAYLOAD_SERIALIZER = BinarySerializer(dict(PAYLOAD_SCHEMA))
+
+# NEP-413 prefix tag (2**31 + 413) as a little-endian u32.
+NEP413_TAG = struct.pack("<I", 2 ** 31 + 413)
+
 def serialize_intent(intent_message, recipient, nonce):
     payload2 = Payload(intent_message, nonce, recipient, None)
-    borsh_payload = BinarySerializer(dict(PAYLOAD_SCHEMA)).serialize(payload2)
+    borsh_payload = PAYLOAD_SERIALIZER.serialize(payload2)
 
-    base_int = 2 ** 31 + 413
-    base_int_serialized = U32.build(base_int)
-    combined_data = base_int_serialized + borsh_payload
+    combined_data = NEP413_TAG + borsh_payload
     hash_result = hashlib.sha256(combined_data).digest()
     return hash_result
@@ -1,23 +1,19 @@
-import base64
 import json
-import time
 from decimal import Decimal
 
-import base58
-import nacl.signing
-import requests
 from nearai.agents.environment import Environment
 
-from intents.utils import get_intent_settled_status, get_withdraw_message_to_sign, generate_nonce, base64_to_uint8array, serialize_intent
-from intents.swap import _intent_swap
+from intents.utils import get_withdraw_message_to_sign, generate_nonce, base64_to_uint8array, serialize_intent
+from intents.consolidate import consolidate
+from intents.settlement import publish_and_wait
+from intents.signer import get_signer, ensure_public_key, invalidate_public_key
+from journal import get_journal, complete, resumes
+from nearclient import get_near
 
 default_mainnet_rpc = "https://rpc.mainnet.near.org"
 
 import re
 
-with open("tokens.json", "r") as file:
-    data = json.load(file)
-
 INTENTS_CONTRACT = "intents.near"
 url = "https://solver-relay-v2.chaindefuser.com/rpc"
 
@@ -32,50 +28,41 @@ FT_TRANSFER_GAS = 50000000000000
 FT_MINIMUM_STORAGE_BALANCE_LARGE = 1250000000000000000000
 
 
-async def withdraw_from_intents(env: Environment, token, amount, receiver_id, data, token_data=None):
-    
+async def withdraw_from_intents(env: Environment, token, amount, receiver_id, data, token_data=None, flow=None):
+    """Withdraws from intents.near and returns the NEAR transaction hash."""
+    flow = flow or get_journal().start("intents_withdraw", {"token": token, "amount": str(amount), "receiver_id": receiver_id})
+    if flow.finished:
+        return flow.state.get("result")
+    if "asset_id" not in flow.state:
+        flow.record("prepared", asset_id=token_data["defuse_asset_id"])
+    return await complete(flow, _withdraw_from_intents(env, token, amount, receiver_id, data, token_data, flow))
+
+
+@resumes("intents_withdraw")
+async def _resume_withdraw(env: Environment, data, flow):
+    params = flow.params
+    return await withdraw_from_intents(env, params["token"], params["amount"], params["receiver_id"], data,
+                                       data.by_asset_id(flow.state["asset_id"]), flow)
+
+
+async def _withdraw_from_intents(env: Environment, token, amount, receiver_id, data, token_data, flow):
+    if flow.reached("publishing"):
+        return await _publish_withdraw(env, flow.state["request"], flow)
+
     user_account_id = env.env_vars.get("ACCOUNT_ID")
-    user_private_key = env.env_vars.get("PRIVATE_KEY")
-    near = env.set_near(user_account_id, user_private_key)
 
-    amount = int(Decimal(amount) * Decimal(10) ** int(token_data["decimals"]))
+    amount = int(Decimal(amount) * data.scale(token_data))
 
-    if amount < int(token_data["min_withdraw_amount"]):
+    if amount < int(token_data.get("min_withdraw_amount") or 0):
         env.add_reply(f"You need to withdraw at minimum {token_data['min_withdraw_amount']} {token} or else you may lose your money.")
         return False
 
     contract_id = token_data["defuse_asset_id"].replace("nep141:", "")
 
 
-    token_list = [obj for obj in data if obj["symbol"] == token.upper()]
-    
-    if len(token_list) > 1:
-        contract_list = [obj["defuse_asset_id"] for obj in token_list]
-        tr = await near.view("intents.near", "mt_batch_balance_of",
-                    {
-                        "account_id": user_account_id,
-                        "token_ids": contract_list,
-                    })
-        result = tr.result
-        i = 0
-        j = contract_list.index(token_data["defuse_asset_id"])
-        result[j] = Decimal(result[j]) / (Decimal(10) ** int(token_data["decimals"]))
-
-        for i, token_obj in enumerate(token_list):
-            if i == j or Decimal(result[i]) == 0:
-                continue
-            result[i] = Decimal(result[i]) / (Decimal(10) ** int(token_obj["decimals"]))
-            if result[j] >= Decimal(amount):
-                break
-
-            amount_swapped = await _intent_swap(env, token_obj["symbol"], token_data["symbol"], result[i], data, token_obj["defuse_asset_id"], token_data["defuse_asset_id"])
-            
-            result[i] = 0
-            result[j] = result[j] + amount_swapped
-
-            i = i + 1
-            
-    near = env.set_near(user_account_id, user_private_key)
+    await consolidate(env, data, token_data, Decimal(amount) / data.scale(token_data))
+
+    near = get_near(env)
     args = {
         "account_id": user_account_id,
         "token_ids": [token_data["defuse_asset_id"]],
@@ -92,19 +79,10 @@ async def withdraw_from_intents(env: Environment, token, amount, receiver_id, da
     nonce_uint8array = base64_to_uint8array(nonce)
     quote_hash_solver = serialize_intent(message_str, INTENTS_CONTRACT, nonce_uint8array)
 
-    private_key_base58 = user_private_key[len(ED_PREFIX):]
-    private_key_bytes = base58.b58decode(private_key_base58)
-
-    if len(private_key_bytes) != 64:
-        raise ValueError("The private key must be exactly 64 bytes long")
+    signer = get_signer(env)
+    signature = signer.sign(quote_hash_solver)
 
-    private_key_seed = private_key_bytes[:32]
-    signing_key = nacl.signing.SigningKey(private_key_seed)
-    public_key = signing_key.verify_key
-    signed = signing_key.sign(quote_hash_solver)
-    
-    final_signature = base58.b58encode(signed.signature).decode("utf-8")
-    public_key_base58 = base58.b58encode(public_key.encode()).decode("utf-8")
+    await ensure_public_key(env, signer)
 
     request = {
         "id": 1,
@@ -120,28 +98,28 @@ async def withdraw_from_intents(env: Environment, token, amount, receiver_id, da
                         "recipient": INTENTS_CONTRACT,
                     },
                     "standard": "nep413",
-                    "signature": f"ed25519:{final_signature}",
-                    "public_key": f"ed25519:{base58.b58encode(public_key.encode()).decode()}",
+                    "signature": signature,
+                    "public_key": signer.public_key,
                 }
             }
         ]
     }
 
-    response = requests.post(url, headers=headers, json=request)
-    response.raise_for_status()
-    resp = response.json()
+    return await _publish_withdraw(env, request, flow)
+
 
-    if resp["result"]["status"] == "OK":
-        intent_hash = resp["result"]["intent_hash"]
+async def _publish_withdraw(env: Environment, request, flow):
+    resp, settled, intent_hash, result = await publish_and_wait(request, flow)
 
-        settled, result = get_intent_settled_status(intent_hash)
-        if settled:
-            transaction_hash = result["result"]["data"]["hash"]
-            env.add_reply(f"Transaction Hash: {transaction_hash}")
-            return True
+    if intent_hash is None:
+        signed_data = request["params"][0]["signed_data"]
+        invalidate_public_key(env.env_vars.get("ACCOUNT_ID"), signed_data["public_key"])
+        return None
 
-        else:
-            return None
+    if settled:
+        transaction_hash = result["result"]["data"]["hash"]
+        env.add_reply(f"Transaction Hash: {transaction_hash}")
+        return transaction_hash
 
     else:
         return None
@@ -0,0 +1,143 @@
+import asyncio
+import itertools
+import time
+
+import runtime
+from progress import emit
+
+# Jobs running at once across all chains.
+MAX_CONCURRENT_JOBS = 4
+# Jobs running at once per chain. zcashd picks notes per wallet, so ZEC
+# sends go one at a time.
+CHAIN_LIMITS = {"zec": 1, "near": 4}
+
+# Chains touched by each journaled flow kind, used when resuming.
+FLOW_CHAINS = {
+    "deposit": ("near",),
+    "zec_deposit": ("zec",),
+    "intent_swap": ("near",),
+    "intents_withdraw": ("near",),
+    "zec_withdraw": ("near", "zec"),
+    "swap": ("near", "zec"),
+}
+
+
+class _JobEnv:
+    """Environment proxy that keeps a job's replies with the job instead of the current turn."""
+
+    def __init__(self, env, job):
+        self._env = env
+        self._job = job
+
+    def add_reply(self, message, *args, **kwargs):
+        self._job.messages.append(str(message))
+
+    def __getattr__(self, name):
+        return getattr(self._env, name)
+
+
+class Job:
+    def __init__(self, id, name, chains, flow=None):
+        self.id = id
+        self.name = name
+        self.chains = chains
+        self.flow = flow
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.messages = []
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+
+    def summary(self):
+        elapsed = (self.finished or time.time()) - (self.started or self.created)
+        line = f"Job {self.id} ({self.name}): {self.status}, {elapsed:.0f}s"
+        if self.flow is not None:
+            line += f", stage '{self.flow.stage}'"
+        if self.error:
+            line += f", error: {self.error}"
+        return line
+
+
+class JobScheduler:
+    """Runs long deposit, swap and withdraw flows in the background on the shared loop.
+
+    At most `max_concurrent` jobs run at once, and each chain has its own
+    limit so a queue of ZEC sends does not hold up NEAR work. A job waits
+    for all of its chains in a fixed order, so jobs spanning several
+    chains cannot deadlock each other.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_JOBS, chain_limits=CHAIN_LIMITS):
+        self.max_concurrent = max_concurrent
+        self.chain_limits = chain_limits
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._slots = None
+        self._chain_slots = {}
+
+    def submit(self, env, name, chains, coro_fn, flow=None):
+        """Schedules coro_fn(job_env) and returns the job id right away.
+
+        `coro_fn` receives an environment whose replies are collected on
+        the job, to be shown by job_status.
+        """
+        job = Job(str(next(self._ids)), name, tuple(sorted(set(chains))), flow)
+        self.jobs[job.id] = job
+        job.future = runtime.submit(self._run(job, coro_fn(_JobEnv(env, job))))
+        return job.id
+
+    def submit_flow(self, env, flow, coro_fn):
+        """Schedules the resume of a journaled flow on the chains its kind uses."""
+        chains = FLOW_CHAINS.get(flow.kind, ("near",))
+        return self.submit(env, f"resume {flow.kind}", chains, coro_fn, flow)
+
+    def _chain_slot(self, chain):
+        if chain not in self._chain_slots:
+            self._chain_slots[chain] = asyncio.Semaphore(self.chain_limits.get(chain, self.max_concurrent))
+        return self._chain_slots[chain]
+
+    async def _run(self, job, coro):
+        # Semaphores belong to the loop they are used on, so create them here.
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+
+        acquired = []
+        try:
+            for chain in job.chains:
+                await self._chain_slot(chain).acquire()
+                acquired.append(chain)
+            async with self._slots:
+                job.status = "running"
+                job.started = time.time()
+                emit("job", id=job.id, name=job.name, status=job.status)
+                job.result = await coro
+                if job.result:
+                    job.status = "done"
+                elif job.flow is not None and not job.flow.finished:
+                    # Funds are still in flight; the journal resumes it on the next start.
+                    job.status = "suspended"
+                else:
+                    job.status = "failed"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            for chain in acquired:
+                self._chain_slot(chain).release()
+            job.finished = time.time()
+            coro.close()
+            emit("job", id=job.id, name=job.name, status=job.status, error=job.error)
+
+        return job.result
+
+    def get(self, job_id):
+        return self.jobs.get(str(job_id))
+
+    def active(self):
+        return [job for job in self.jobs.values() if job.status in ("queued", "running")]
+
+
+scheduler = JobScheduler()
@@ -0,0 +1,260 @@
+import inspect
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+import runtime
+
+JOURNAL_FILE = ".journal.sqlite"
+# A flow whose resume raised this many times is given up on.
+RESUME_ATTEMPTS = 3
+
+FINISHED_STAGES = ("done", "failed")
+# Stages recorded just before something that cannot be taken back goes out:
+# a published intent, a zcashd transfer or a NEAR transaction.
+IRREVERSIBLE_STAGES = ("publishing", "sending")
+
+resumers = {}
+
+
+def resumes(kind):
+    """Registers the function that picks up unfinished flows of `kind`.
+
+    It is called as fn(env, data, flow) and may be a coroutine function.
+    """
+    def register(fn):
+        resumers[kind] = fn
+        return fn
+    return register
+
+
+class Flow:
+    """One multi-stage operation. `state` merges the data of every recorded stage."""
+
+    def __init__(self, journal, id, kind, params, parent=None, stages=None, state=None):
+        self.journal = journal
+        self.id = id
+        self.kind = kind
+        self.params = params
+        self.parent = parent
+        self.stages = stages or []
+        self.state = state or {}
+
+    @property
+    def stage(self):
+        return self.stages[-1] if self.stages else None
+
+    @property
+    def finished(self):
+        return self.stage in FINISHED_STAGES
+
+    @property
+    def succeeded(self):
+        """Finished as done; a failed flow is finished but never succeeded."""
+        return self.stage == "done"
+
+    def reached(self, stage):
+        return stage in self.stages
+
+    @property
+    def irreversible(self):
+        """True once anything was sent that a re-run could repeat, here or in a sub-flow still open."""
+        if any(stage in IRREVERSIBLE_STAGES or stage.endswith("_sending") for stage in self.stages):
+            return True
+        return self.journal.has_open_children(self)
+
+    def record(self, stage, **data):
+        self.journal.append(self, stage, data)
+
+    def finish(self, result=None):
+        self.record("done", result=result)
+        return result
+
+    def fail(self, reason):
+        self.record("failed", reason=str(reason))
+
+    def suspend(self, reason):
+        """Leaves the flow open for the next resume, e.g. when a wait timed out with funds in flight."""
+        self.record("suspended", reason=str(reason))
+
+    def child(self, kind, params):
+        """Returns this flow's sub-flow of `kind`, starting it if it does not exist yet."""
+        return self.journal.child(self, kind, params)
+
+
+class Journal:
+    """Append-only record of stage transitions, kept in SQLite.
+
+    Every transition is one row in `events` and is never rewritten; a flow's
+    state is rebuilt by replaying its events. The database runs in WAL mode
+    with synchronous=NORMAL, so a commit is one append to the WAL and fsyncs
+    are batched at checkpoints: transitions survive the process being
+    killed, which is what resuming needs.
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS flows (
+                id TEXT PRIMARY KEY,
+                parent TEXT,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                flow TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                data TEXT NOT NULL,
+                at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS events_flow ON events (flow, seq);
+            CREATE INDEX IF NOT EXISTS flows_parent ON flows (parent, kind);
+        """)
+
+    def start(self, kind, params, parent=None):
+        flow = Flow(self, uuid.uuid4().hex, kind, params, parent)
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("INSERT INTO flows VALUES (?, ?, ?, ?, ?)",
+                             (flow.id, parent, kind, json.dumps(params, default=str), time.time()))
+            self._insert_event(flow, "started", {})
+            self._db.execute("COMMIT")
+        return flow
+
+    def _insert_event(self, flow, stage, data):
+        self._db.execute("INSERT INTO events (flow, stage, data, at) VALUES (?, ?, ?, ?)",
+                         (flow.id, stage, json.dumps(data, default=str), time.time()))
+        flow.stages.append(stage)
+        flow.state.update(data)
+
+    def append(self, flow, stage, data):
+        with self._lock:
+            self._insert_event(flow, stage, data)
+
+    def _load(self, row):
+        id, parent, kind, params = row
+        flow = Flow(self, id, kind, json.loads(params), parent)
+        for stage, data in self._db.execute("SELECT stage, data FROM events WHERE flow = ? ORDER BY seq", (id,)):
+            flow.stages.append(stage)
+            flow.state.update(json.loads(data))
+        return flow
+
+    def get(self, flow_id):
+        with self._lock:
+            row = self._db.execute("SELECT id, parent, kind, params FROM flows WHERE id = ?", (flow_id,)).fetchone()
+            return self._load(row) if row else None
+
+    def child(self, parent, kind, params):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, parent, kind, params FROM flows WHERE parent = ? AND kind = ? ORDER BY created DESC LIMIT 1",
+                (parent.id, kind)).fetchone()
+            if row:
+                return self._load(row)
+        return self.start(kind, params, parent.id)
+
+    def has_open_children(self, flow):
+        with self._lock:
+            row = self._db.execute("""
+                SELECT 1 FROM flows f
+                WHERE f.parent = ? AND (
+                    SELECT stage FROM events e WHERE e.flow = f.id ORDER BY seq DESC LIMIT 1
+                ) NOT IN (?, ?)
+                LIMIT 1
+            """, (flow.id, *FINISHED_STAGES)).fetchone()
+            return row is not None
+
+    def unfinished(self):
+        """Top-level flows whose last stage is neither done nor failed, oldest first."""
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT f.id, f.parent, f.kind, f.params FROM flows f
+                WHERE f.parent IS NULL AND (
+                    SELECT stage FROM events e WHERE e.flow = f.id ORDER BY seq DESC LIMIT 1
+                ) NOT IN (?, ?)
+                ORDER BY f.created
+            """, FINISHED_STAGES).fetchall()
+            return [self._load(row) for row in rows]
+
+
+_journal = None
+_resumed = False
+
+
+def get_journal():
+    global _journal
+    if _journal is None:
+        _journal = Journal()
+    return _journal
+
+
+def resume_all(env, data, submit=None):
+    """Picks up every unfinished flow where it stopped. Runs once per process.
+
+    Flows are resumed one after another on the shared loop, or handed to
+    `submit(flow, coro_fn)` to run in the background, where coro_fn(env)
+    returns the resuming coroutine.
+    """
+    global _resumed
+    if _resumed:
+        return
+    _resumed = True
+
+    for flow in get_journal().unfinished():
+        if flow.kind not in resumers:
+            continue
+
+        env.add_reply(f"Resuming unfinished {flow.kind} from stage '{flow.stage}'")
+        if submit is None:
+            runtime.run(resume_flow(env, data, flow))
+        else:
+            submit(flow, lambda job_env, flow=flow: resume_flow(job_env, data, flow))
+
+
+async def resume_flow(env, data, flow):
+    try:
+        result = resumers[flow.kind](env, data, flow)
+        if inspect.iscoroutine(result):
+            result = await result
+        return result
+    except Exception as e:
+        if not flow.finished and not flow.irreversible:
+            flow.fail(f"resume failed: {e}")
+        elif not flow.finished:
+            flow.record("resume_error", error=str(e))
+            if flow.stages.count("resume_error") >= RESUME_ATTEMPTS:
+                flow.fail(f"resume failed {RESUME_ATTEMPTS} times: {e}")
+        env.add_reply(f"Could not resume {flow.kind}: {e}")
+
+
+async def complete(flow, coro):
+    """Awaits the body of a flow and records its outcome.
+
+    A truthy result finishes the flow with it; False or None, which the
+    tools return after reporting an error, marks it failed unless the flow
+    or one of its sub-flows was suspended. An exception fails the flow too,
+    unless an irreversible stage was recorded before it: only then is the
+    flow left open for the next start to resume.
+    """
+    try:
+        result = await coro
+    except Exception as e:
+        if not flow.finished and not flow.irreversible:
+            flow.fail(f"raised {e!r}")
+        raise
+    if not flow.finished and flow.stage != "suspended":
+        if result:
+            flow.finish(result)
+        elif flow.journal.has_open_children(flow):
+            flow.suspend("waiting on a suspended step")
+        else:
+            flow.fail(f"returned {result!r}")
+    return result
@@ -0,0 +1,166 @@
+import asyncio
+import time
+
+from runtime import get_http_client
+
+DEFAULT_RPC = "https://rpc.mainnet.near.org"
+HEALTH_TIMEOUT = 2.0
+# Seconds between background health checks of all endpoints.
+HEALTH_INTERVAL = 60
+# Seconds a failed endpoint is passed over before it is tried again.
+UNHEALTHY_COOLDOWN = 30
+
+# Errors meaning the request never reached the endpoint. Matched by class
+# name so py_near and aiohttp are not imported here.
+UNREACHABLE_ERRORS = {"ClientConnectorError", "ConnectionRefusedError", "gaierror"}
+# Errors after which a read can safely go to another endpoint. Transactions
+# are not resent after these since the first one may have gone through.
+TRANSIENT_ERRORS = UNREACHABLE_ERRORS | {
+    "ClientConnectionError", "ClientOSError", "ClientPayloadError", "ServerDisconnectedError",
+    "ServerTimeoutError", "TimeoutError", "RpcTimeoutError",
+}
+
+
+def _is_error(e, names):
+    return any(cls.__name__ in names for cls in type(e).__mro__)
+
+
+class _Endpoint:
+    def __init__(self, url):
+        # None is the RPC nearai is configured with.
+        self.url = url
+        self.near = None
+        self.latency = None
+        self.down_until = 0
+
+    @property
+    def rpc_url(self):
+        return self.url or DEFAULT_RPC
+
+    def is_up(self):
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self):
+        self.down_until = time.monotonic() + UNHEALTHY_COOLDOWN
+
+
+class NearClient:
+    """One NEAR account handle shared by every flow, spread over one or more RPC endpoints.
+
+    Each endpoint gets a single py_near connection from env.set_near, made
+    on first use and reused afterwards. Reads go to the fastest healthy
+    endpoint and fail over to the next one on connection errors or
+    timeouts; transactions fail over only when the endpoint could not be
+    reached at all. A background `status` check re-ranks the endpoints
+    every HEALTH_INTERVAL seconds.
+    """
+
+    def __init__(self, env, account_id, private_key, urls=()):
+        self.env = env
+        self.account_id = account_id
+        self.private_key = private_key
+        self.endpoints = [_Endpoint(None)] + [_Endpoint(url) for url in urls]
+        self.failovers = 0
+        self._checked_at = 0
+        self._check_task = None
+
+    def _near(self, endpoint):
+        if endpoint.near is None:
+            if endpoint.url is None:
+                endpoint.near = self.env.set_near(self.account_id, self.private_key)
+            else:
+                endpoint.near = self.env.set_near(self.account_id, self.private_key, rpc_addr=endpoint.url)
+        return endpoint.near
+
+    def ordered(self):
+        """Healthy endpoints fastest first, then the ones in cooldown as a last resort."""
+        up = [endpoint for endpoint in self.endpoints if endpoint.is_up()]
+        down = [endpoint for endpoint in self.endpoints if not endpoint.is_up()]
+        up.sort(key=lambda endpoint: endpoint.latency if endpoint.latency is not None else float("inf"))
+        return up + down
+
+    async def view(self, *args, **kwargs):
+        return await self._request("view", TRANSIENT_ERRORS, args, kwargs)
+
+    async def call(self, *args, **kwargs):
+        return await self._request("call", UNREACHABLE_ERRORS, args, kwargs)
+
+    async def _request(self, method, retry_on, args, kwargs):
+        self._schedule_health_check()
+        error = None
+
+        for endpoint in self.ordered():
+            try:
+                return await getattr(self._near(endpoint), method)(*args, **kwargs)
+            except Exception as e:
+                if len(self.endpoints) == 1 or not _is_error(e, retry_on):
+                    raise
+                print(f"NEAR RPC {endpoint.rpc_url} failed on {method}: {e!r}")
+                endpoint.mark_down()
+                self.failovers += 1
+                error = e
+
+        raise error
+
+    async def health_check(self):
+        """Pings every endpoint with `status` and records its latency, marking unreachable or syncing ones down."""
+        self._checked_at = time.monotonic()
+        await asyncio.gather(*(self._check(endpoint) for endpoint in self.endpoints))
+
+    async def _check(self, endpoint):
+        started = time.monotonic()
+        try:
+            response = await get_http_client().post(
+                endpoint.rpc_url,
+                json={"jsonrpc": "2.0", "id": "health", "method": "status", "params": []},
+                timeout=HEALTH_TIMEOUT,
+            )
+            response.raise_for_status()
+            syncing = response.json()["result"]["sync_info"]["syncing"]
+        except Exception as e:
+            print(f"NEAR RPC {endpoint.rpc_url} failed its health check: {e!r}")
+            endpoint.mark_down()
+            return
+
+        if syncing:
+            endpoint.mark_down()
+        else:
+            endpoint.latency = time.monotonic() - started
+            endpoint.down_until = 0
+
+    def _schedule_health_check(self):
+        if len(self.endpoints) == 1 or time.monotonic() - self._checked_at < HEALTH_INTERVAL:
+            return
+        if self._check_task is None or self._check_task.done():
+            self._checked_at = time.monotonic()
+            self._check_task = asyncio.get_running_loop().create_task(self.health_check())
+
+    def __getattr__(self, name):
+        # Anything else py_near offers goes to the primary endpoint.
+        if name.startswith("_") or name == "endpoints":
+            raise AttributeError(name)
+        return getattr(self._near(self.endpoints[0]), name)
+
+
+def rpc_urls(env):
+    """Extra NEAR RPC endpoints from NEAR_RPC_URLS (comma separated)."""
+    urls = []
+    for url in (env.env_vars.get("NEAR_RPC_URLS", "") or "").split(","):
+        url = url.strip()
+        if url and url not in urls:
+            urls.append(url)
+    return tuple(urls)
+
+
+_clients = {}
+
+
+def get_near(env, account_id=None, private_key=None):
+    """The shared NearClient for an account, ACCOUNT_ID/PRIVATE_KEY by default."""
+    account_id = account_id or env.env_vars.get("ACCOUNT_ID")
+    private_key = private_key or env.env_vars.get("PRIVATE_KEY")
+    key = (account_id, private_key, rpc_urls(env))
+
+    if key not in _clients:
+        _clients[key] = NearClient(env, account_id, private_key, key[2])
+    return _clients[key]
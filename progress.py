@@ -0,0 +1,42 @@
+_listeners = []
+
+
+def subscribe(listener):
+    """Calls listener(event, fields) for every progress event until unsubscribed."""
+    if listener not in _listeners:
+        _listeners.append(listener)
+    return listener
+
+
+def unsubscribe(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def emit(event, **fields):
+    """Reports a step of a deposit, swap or withdrawal to whoever is listening.
+
+    Events: "quote", "published", "settled", "txid" and "job". Listener
+    errors are printed and never reach the flow that emitted the event.
+    """
+    for listener in list(_listeners):
+        try:
+            listener(event, fields)
+        except Exception as e:
+            print(f"Progress listener failed on {event}: {e!r}")
+
+
+def describe(event, fields):
+    """One line of text for a progress event."""
+    if event == "quote":
+        return f"Quote received: {fields.get('amount_in')} {fields.get('asset_in')} -> {fields.get('amount_out')} {fields.get('asset_out')}"
+    if event == "published":
+        return f"Intent published: {fields.get('intent_hash')}"
+    if event == "settled":
+        line = f"Intent {'settled' if fields.get('settled') else 'not settled'}: {fields.get('intent_hash')}"
+        return line + (f", transaction {fields['tx_hash']}" if fields.get("tx_hash") else "")
+    if event == "txid":
+        return f"{fields.get('chain', '').upper()} transaction: {fields.get('txid')}"
+    if event == "job":
+        return f"Job {fields.get('id')} ({fields.get('name')}): {fields.get('status')}"
+    return f"{event}: {fields}"
@@ -0,0 +1,133 @@
+import json
+from decimal import Decimal, InvalidOperation
+
+# Column order and headers for the balance fields the agent produces.
+BALANCE_COLUMNS = (
+    (("symbol", "TOKEN"), "Token"),
+    (("blockchain",), "Chain"),
+    (("balance", "AMOUNT"), "Amount"),
+    (("balance_usd", "AMOUNT_IN_USD"), "Value (USD)"),
+    (("contractId",), "Contract"),
+)
+USD_FIELDS = ("balance_usd", "AMOUNT_IN_USD")
+# Decimal places shown for token amounts.
+AMOUNT_PLACES = 8
+
+
+def _decimal(value):
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def format_amount(value, places=AMOUNT_PLACES):
+    amount = _decimal(value)
+    if amount is None:
+        return str(value)
+    amount = amount.quantize(Decimal(1).scaleb(-places)).normalize()
+    return f"{amount:,f}"
+
+
+def format_usd(value):
+    amount = _decimal(value)
+    if amount is None:
+        return str(value)
+    return f"${amount:,.2f}"
+
+
+def _cell(value):
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+def table(headers, rows):
+    lines = ["| " + " | ".join(headers) + " |", "|" + "|".join(" --- " for _ in headers) + "|"]
+    lines += ["| " + " | ".join(_cell(value) for value in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+def render_error(message):
+    return f"🔴 **Error:** {message}"
+
+
+def render_info(message):
+    return f"🔵 {message}"
+
+
+def render_transaction(tx_hash, title="Transaction sent"):
+    return f"🟢 **{title}**\n\nTransaction Hash: `{tx_hash}`"
+
+
+def render_balances(title, entries):
+    """Markdown table of balance entries from _wallet_balance or _Intents_balance, with a USD total."""
+    present = [(keys, header) for keys, header in BALANCE_COLUMNS if any(key in entry for entry in entries for key in keys)]
+    rows = []
+    warnings = []
+    total = Decimal(0)
+
+    for entry in entries:
+        if "source" in entry and entry.get("status") == "indexing":
+            warnings.append(f"🟡 {entry['symbol']} balance is not ready yet: the {entry['source']} wallet is still being indexed, ask again in a moment.")
+            continue
+        if "source" in entry and entry.get("status") == "unavailable":
+            name = f"{entry['symbol']} balance" if "symbol" in entry else f"{entry['source']} balances"
+            warnings.append(f"🟡 {name} could not be fetched right now.")
+            continue
+
+        row = []
+        for keys, header in present:
+            key = next((key for key in keys if key in entry), None)
+            if key is None:
+                row.append("")
+            elif key in USD_FIELDS:
+                row.append(format_usd(entry[key]))
+                total += _decimal(entry[key]) or 0
+            elif header == "Amount":
+                row.append(format_amount(entry[key]))
+            else:
+                row.append(entry[key])
+        if entry.get("status") == "stale":
+            row[0] = f"{row[0]} (cached)"
+        rows.append(row)
+
+    lines = [f"## {title}", ""]
+    if rows:
+        lines.append(table([header for _, header in present], rows))
+        if any(key in USD_FIELDS for keys, _ in present for key in keys):
+            lines += ["", f"**Total value:** {format_usd(total)}"]
+    else:
+        lines.append(render_info("No tokens found."))
+
+    if any(entry.get("status") == "stale" for entry in entries):
+        lines += ["", "🟡 Balances marked (cached) are the last known values; their source did not answer."]
+    for warning in warnings:
+        lines += ["", warning]
+    return "\n".join(lines)
+
+
+def render_tokens(tokens):
+    """Markdown table of token details, as returned by the token_info tool."""
+    rows = [(token["symbol"], token["blockchain"], f"`{token['defuse_asset_id']}`", f"`{token.get('contract_address', '')}`",
+             token["decimals"], format_amount(token.get("min_withdraw_amount", 0))) for token in tokens]
+    return table(["Token", "Chain", "Asset id", "Contract", "Decimals", "Min withdraw"], rows)
+
+
+def render_reply(data, prompt):
+    """Markdown for a tool result: balance lists become tables, plain messages stay as text."""
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return render_info(data)
+
+    if isinstance(data, dict):
+        if "error" in data:
+            return render_error(data["error"])
+        if "hash" in data:
+            return render_transaction(data["hash"])
+        data = [data]
+
+    if isinstance(data, list) and all(isinstance(entry, dict) for entry in data):
+        return render_balances(prompt[:1].upper() + prompt[1:], data)
+
+    return render_info(str(data))
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+
+import httpx
+
+HTTP_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+_loop = None
+_loop_lock = threading.Lock()
+_client = None
+
+
+def get_loop():
+    """Returns the process-wide event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="agent-event-loop", daemon=True).start()
+        return _loop
+
+
+def run(coro):
+    """Runs a coroutine on the shared loop and blocks the calling thread until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
+
+
+def submit(coro):
+    """Schedules a coroutine on the shared loop and returns its concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def get_http_client():
+    """Returns the shared AsyncClient. Must be called from a coroutine running on the shared loop."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    return _client
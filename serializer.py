@@ -1,8 +1,424 @@
+import struct
+
+_INT_FORMATS = {1: struct.Struct('<B'), 2: struct.Struct('<H'), 4: struct.Struct('<I'), 8: struct.Struct('<Q')}
+_U32 = _INT_FORMATS[4]
+
+
+class _Codec:
+    """Compiled encoder/decoder for one schema field type.
+
+    `fixed` is the encoded size when it does not depend on the value, else None.
+    `size(value)` returns the encoded size, `write(buf, offset, value)` packs the
+    value into a preallocated buffer and returns the new offset,
+    `read(buf, offset)` returns `(value, new_offset)` and `skip(buf, offset)`
+    returns the offset past the value without decoding it. Readers work on
+    memoryviews and never copy the input.
+    """
+
+    __slots__ = ('fixed', 'size', 'write', 'read', 'skip')
+
+    def __init__(self, fixed=None, size=None, write=None, read=None, skip=None):
+        self.fixed = fixed
+        self.size = size
+        self.write = write
+        self.read = read
+        if skip is None and fixed is not None:
+            skip = lambda buf, offset: offset + fixed
+        self.skip = skip
+
+
+def _int_codec(n_bytes):
+    if n_bytes in _INT_FORMATS:
+        fmt = _INT_FORMATS[n_bytes]
+        pack_into, unpack_from = fmt.pack_into, fmt.unpack_from
+
+        def write(buf, offset, value):
+            pack_into(buf, offset, value)
+            return offset + n_bytes
+
+        def read(buf, offset):
+            return unpack_from(buf, offset)[0], offset + n_bytes
+    else:
+        def write(buf, offset, value):
+            buf[offset:offset + n_bytes] = value.to_bytes(n_bytes, 'little')
+            return offset + n_bytes
+
+        def read(buf, offset):
+            return int.from_bytes(buf[offset:offset + n_bytes], 'little'), offset + n_bytes
+
+    return _Codec(n_bytes, lambda value: n_bytes, write, read)
+
+
+def _bool_codec():
+    def write(buf, offset, value):
+        assert isinstance(value, bool), str(type(value))
+        buf[offset] = value
+        return offset + 1
+
+    def read(buf, offset):
+        value = buf[offset]
+        assert 0 <= value <= 1, f"Fail to deserialize bool: {value}"
+        return bool(value), offset + 1
+
+    return _Codec(1, lambda value: 1, write, read)
+
+
+def _string_codec():
+    pack_into, unpack_from = _U32.pack_into, _U32.unpack_from
+    # str() decodes straight from the buffer, so no intermediate bytes object is made.
+
+    def size(value):
+        return 4 + (len(value) if value.isascii() else len(value.encode('utf8')))
+
+    def write(buf, offset, value):
+        b = value.encode('utf8')
+        n = len(b)
+        pack_into(buf, offset, n)
+        offset += 4
+        buf[offset:offset + n] = b
+        return offset + n
+
+    def read(buf, offset):
+        n = unpack_from(buf, offset)[0]
+        offset += 4
+        return str(buf[offset:offset + n], 'utf8'), offset + n
+
+    def skip(buf, offset):
+        return offset + 4 + unpack_from(buf, offset)[0]
+
+    return _Codec(None, size, write, read, skip)
+
+
+def _fixed_bytes_codec(n):
+    def write(buf, offset, value):
+        assert type(value) == bytes
+        assert len(value) == n, "len(%s) = %s != %s" % (value, len(value), n)
+        buf[offset:offset + n] = value
+        return offset + n
+
+    def read(buf, offset):
+        return bytes(buf[offset:offset + n]), offset + n
+
+    return _Codec(n, lambda value: n, write, read)
+
+
+def _vec_codec(inner):
+    pack_into, unpack_from = _U32.pack_into, _U32.unpack_from
+
+    if inner.fixed is not None:
+        fixed = inner.fixed
+
+        def size(value):
+            return 4 + fixed * len(value)
+
+        def skip(buf, offset):
+            return offset + 4 + fixed * unpack_from(buf, offset)[0]
+    else:
+        def size(value):
+            inner_size = inner.size
+            return 4 + sum(inner_size(el) for el in value)
+
+        def skip(buf, offset):
+            n = unpack_from(buf, offset)[0]
+            offset += 4
+            for _ in range(n):
+                offset = inner.skip(buf, offset)
+            return offset
+
+    # inner may still be the placeholder of a recursive struct here, so its
+    # functions are looked up once per call rather than bound now.
+    def write(buf, offset, value):
+        inner_write = inner.write
+        pack_into(buf, offset, len(value))
+        offset += 4
+        for el in value:
+            offset = inner_write(buf, offset, el)
+        return offset
+
+    def read(buf, offset):
+        inner_read = inner.read
+        n = unpack_from(buf, offset)[0]
+        offset += 4
+        ret = []
+        for _ in range(n):
+            el, offset = inner_read(buf, offset)
+            ret.append(el)
+        return ret, offset
+
+    return _Codec(None, size, write, read, skip)
+
+
+def _option_codec(inner):
+    def size(value):
+        return 1 if value is None else 1 + inner.size(value)
+
+    def write(buf, offset, value):
+        if value is None:
+            buf[offset] = 0
+            return offset + 1
+        buf[offset] = 1
+        return inner.write(buf, offset + 1, value)
+
+    def read(buf, offset):
+        if buf[offset] == 0:
+            return None, offset + 1
+        return inner.read(buf, offset + 1)
+
+    def skip(buf, offset):
+        if buf[offset] == 0:
+            return offset + 1
+        return inner.skip(buf, offset + 1)
+
+    return _Codec(None, size, write, read, skip)
+
+
+def _tuple_codec(codecs):
+    fixed = None
+    if all(c.fixed is not None for c in codecs):
+        fixed = sum(c.fixed for c in codecs)
+
+    def size(value):
+        return sum(c.size(v) for c, v in zip(codecs, value))
+
+    def write(buf, offset, value):
+        assert len(value) == len(codecs)
+        for c, v in zip(codecs, value):
+            offset = c.write(buf, offset, v)
+        return offset
+
+    def read(buf, offset):
+        ret = []
+        for c in codecs:
+            v, offset = c.read(buf, offset)
+            ret.append(v)
+        return tuple(ret), offset
+
+    def skip(buf, offset):
+        for c in codecs:
+            offset = c.skip(buf, offset)
+        return offset
+
+    return _Codec(fixed, size, write, read, skip)
+
+
+def _empty_codec():
+    return _Codec(0, lambda value: 0, lambda buf, offset, value: offset, lambda buf, offset: (None, offset))
+
+
+def _compile_struct(type_, fields, codec_for):
+    """Generates size/write/read functions specialised to one struct's field list."""
+    names = [name for name, _ in fields]
+    assert all(name.isidentifier() for name in names), names
+    codecs = [codec_for(field_type) for _, field_type in fields]
+
+    namespace = {'type_': type_}
+    fixed_total = 0
+    size_terms = []
+    write_lines = []
+    read_lines = []
+    skip_lines = []
+    for i, (name, codec) in enumerate(zip(names, codecs)):
+        namespace[f'w{i}'] = codec.write
+        namespace[f'r{i}'] = codec.read
+        if codec.fixed is not None:
+            fixed_total += codec.fixed
+            skip_lines.append(f'    offset += {codec.fixed}')
+        else:
+            namespace[f's{i}'] = codec.size
+            namespace[f'k{i}'] = codec.skip
+            size_terms.append(f's{i}(obj.{name})')
+            skip_lines.append(f'    offset = k{i}(buf, offset)')
+        write_lines.append(f'    offset = w{i}(buf, offset, obj.{name})')
+        read_lines.append(f'    ret.{name}, offset = r{i}(buf, offset)')
+
+    source = '\n'.join([
+        'def size(obj):',
+        f'    return {" + ".join([str(fixed_total)] + size_terms)}',
+        'def write(buf, offset, obj):',
+        '    assert type(obj) == type_, "%s != type(%s)" % (type_, obj)',
+        *write_lines,
+        '    return offset',
+        'def read(buf, offset):',
+        '    ret = type_()',
+        *read_lines,
+        '    return ret, offset',
+        'def skip(buf, offset):',
+        *skip_lines,
+        '    return offset',
+    ])
+    exec(compile(source, f'<borsh {type_.__name__}>', 'exec'), namespace)
+    fixed = fixed_total if not size_terms else None
+    return fixed, namespace['size'], namespace['write'], namespace['read'], namespace['skip']
+
+
+def _compile_enum(type_, struct_schema, codec_for):
+    tag_field = struct_schema['field']
+    variants = [(name, codec_for(field_type)) for name, field_type in struct_schema['values']]
+    index = {name: idx for idx, (name, _) in enumerate(variants)}
+
+    def size(obj):
+        name = getattr(obj, tag_field)
+        return 1 + variants[index[name]][1].size(getattr(obj, name))
+
+    def write(buf, offset, obj):
+        name = getattr(obj, tag_field)
+        assert name in index, name
+        buf[offset] = index[name]
+        return variants[index[name]][1].write(buf, offset + 1, getattr(obj, name))
+
+    def read(buf, offset):
+        ret = type_()
+        name, codec = variants[buf[offset]]
+        setattr(ret, tag_field, name)
+        value, offset = codec.read(buf, offset + 1)
+        setattr(ret, name, value)
+        return ret, offset
+
+    def skip(buf, offset):
+        return variants[buf[offset]][1].skip(buf, offset + 1)
+
+    return None, size, write, read, skip
+
+
+class _StructLayout:
+    """Field order, codecs and nested-struct markers used by LazyStruct."""
+
+    __slots__ = ('type_', 'names', 'index', 'codecs', 'nested')
+
+    def __init__(self, type_, names, codecs, nested):
+        self.type_ = type_
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.codecs = codecs
+        self.nested = nested
+
+
+class LazyStruct:
+    """Read-only view of a serialized struct that decodes fields on first access.
+
+    Field offsets are found by skipping earlier fields without decoding them,
+    and decoded values are cached. Struct-typed fields come back as nested
+    views. Call `materialize()` to get a regular object.
+    """
+
+    __slots__ = ('_serializer', '_layout', '_buf', '_offsets', '_values')
+
+    def __init__(self, serializer, layout, buf, offset):
+        self._serializer = serializer
+        self._layout = layout
+        self._buf = buf
+        self._offsets = [offset]
+        self._values = {}
+
+    def _offset(self, i):
+        offsets = self._offsets
+        codecs = self._layout.codecs
+        while len(offsets) <= i:
+            offsets.append(codecs[len(offsets) - 1].skip(self._buf, offsets[-1]))
+        return offsets[i]
+
+    def __getattr__(self, name):
+        layout = object.__getattribute__(self, '_layout')
+        i = layout.index.get(name)
+        if i is None:
+            raise AttributeError(name)
+
+        values = self._values
+        if i not in values:
+            offset = self._offset(i)
+            if layout.nested[i] is not None:
+                values[i] = LazyStruct(self._serializer, self._serializer._layout(layout.nested[i]), self._buf, offset)
+            else:
+                values[i] = layout.codecs[i].read(self._buf, offset)[0]
+        return values[i]
+
+    def end_offset(self):
+        """Offset just past this struct in the underlying buffer."""
+        return self._offset(len(self._layout.names))
+
+    def materialize(self):
+        return self._serializer._codec(self._layout.type_).read(self._buf, self._offsets[0])[0]
+
+    def __repr__(self):
+        return f"LazyStruct({self._layout.type_.__name__})"
+
+
 class BinarySerializer:
+    """Borsh serializer driven by a schema of the form {type: struct_or_enum_schema}.
+
+    serialize/deserialize use codecs compiled once per field type and struct;
+    the field-by-field methods below remain as the reference implementation.
+    """
 
     def __init__(self, schema):
         self.array = bytearray()
         self.schema = schema
+        self._codecs = {}
+        self._layouts = {}
+
+    def _codec(self, fieldType):
+        key = fieldType if isinstance(fieldType, (str, type)) else repr(fieldType)
+        codec = self._codecs.get(key)
+        if codec is not None:
+            return codec
+
+        if type(fieldType) == tuple:
+            if len(fieldType) == 0:
+                codec = _empty_codec()
+            else:
+                codec = _tuple_codec([self._codec(t) for t in fieldType])
+        elif type(fieldType) == str:
+            if fieldType == 'bool':
+                codec = _bool_codec()
+            elif fieldType[0] == 'u':
+                codec = _int_codec(int(fieldType[1:]) // 8)
+            elif fieldType == 'string':
+                codec = _string_codec()
+            else:
+                assert False, fieldType
+        elif type(fieldType) == list:
+            assert len(fieldType) == 1
+            if type(fieldType[0]) == int:
+                codec = _fixed_bytes_codec(fieldType[0])
+            else:
+                codec = _vec_codec(self._codec(fieldType[0]))
+        elif type(fieldType) == dict:
+            assert fieldType['kind'] == 'option'
+            codec = _option_codec(self._codec(fieldType['type']))
+        elif type(fieldType) == type:
+            # Register first so recursive structs resolve to this codec.
+            codec = _Codec()
+            self._codecs[key] = codec
+            structSchema = self.schema[fieldType]
+            if structSchema['kind'] == 'struct':
+                compiled = _compile_struct(fieldType, structSchema['fields'], self._codec)
+            elif structSchema['kind'] == 'enum':
+                compiled = _compile_enum(fieldType, structSchema, self._codec)
+            else:
+                assert False, structSchema
+            codec.fixed, codec.size, codec.write, codec.read, codec.skip = compiled
+            return codec
+        else:
+            assert False, type(fieldType)
+
+        self._codecs[key] = codec
+        return codec
+
+    def _layout(self, type_):
+        layout = self._layouts.get(type_)
+        if layout is None:
+            structSchema = self.schema[type_]
+            assert structSchema['kind'] == 'struct', structSchema
+            fields = structSchema['fields']
+            layout = _StructLayout(
+                type_,
+                [name for name, _ in fields],
+                [self._codec(field_type) for _, field_type in fields],
+                [field_type if type(field_type) == type and self.schema[field_type]['kind'] == 'struct' else None
+                 for _, field_type in fields],
+            )
+            self._layouts[type_] = layout
+        return layout
 
     def read_bytes(self, n):
         assert n + self.offset <= len(
@@ -149,13 +565,32 @@ class BinarySerializer:
             assert False, structSchema
 
     def serialize(self, obj):
-        self.serialize_struct(obj)
-        return bytes(self.array)
+        codec = self._codec(type(obj))
+        buf = bytearray(codec.size(obj))
+        offset = codec.write(buf, 0, obj)
+        assert offset == len(buf), "%s != %s" % (offset, len(buf))
+        return bytes(buf)
 
     def deserialize(self, bytes_, type_):
-        self.array = bytearray(bytes_)
-        self.offset = 0
-        ret = self.deserialize_field(type_)
-        assert self.offset == len(bytes_), "%s != %s" % (self.offset,
-                                                         len(bytes_))
-        return ret
\ No newline at end of file
+        buf = memoryview(bytes_)
+        ret, offset = self._codec(type_).read(buf, 0)
+        assert offset == len(buf), "%s != %s" % (offset, len(buf))
+        return ret
+
+    def view(self, bytes_, type_, offset=0):
+        """Returns a LazyStruct over bytes_ without decoding any field.
+
+        Unlike deserialize, trailing bytes are not checked; use end_offset().
+        """
+        return LazyStruct(self, self._layout(type_), memoryview(bytes_), offset)
+
+    def iter_views(self, bytes_, type_):
+        """Lazily walks a serialized Vec<type_>, yielding one LazyStruct per element."""
+        buf = memoryview(bytes_)
+        layout = self._layout(type_)
+        skip = self._codec(type_).skip
+        n = _U32.unpack_from(buf, 0)[0]
+        offset = 4
+        for _ in range(n):
+            yield LazyStruct(self, layout, buf, offset)
+            offset = skip(buf, offset)
\ No newline at end of file
@@ -0,0 +1,110 @@
+import threading
+from types import SimpleNamespace
+
+from progress import describe, subscribe
+
+# Redraws per second of the partial reply.
+REFRESH_PER_SECOND = 12
+
+
+class TerminalStream:
+    """Shows a reply on the terminal while it is being generated.
+
+    Model tokens go to a transient live view that disappears when the
+    stream ends, so the final reply is only printed once, the normal way.
+    Anything else printed on the same console, like progress events,
+    appears above it.
+    """
+
+    def __init__(self, console=None):
+        self.console = console or get_console()
+        self.text = ""
+        self._live = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        from rich.live import Live
+
+        self._live = Live(console=self.console, refresh_per_second=REFRESH_PER_SECOND, transient=True)
+        self._live.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._live.stop()
+        return False
+
+    def write(self, text):
+        from rich.markdown import Markdown
+
+        with self._lock:
+            self.text += text
+            self._live.update(Markdown(self.text))
+
+
+_console = None
+
+
+def get_console():
+    """The terminal console shared by streamed replies and progress lines, created on first use."""
+    global _console
+    if _console is None:
+        from rich.console import Console
+
+        _console = Console()
+    return _console
+
+
+def _print_event(event, fields):
+    get_console().print(f"🔵 {describe(event, fields)}")
+
+
+def print_progress():
+    """Prints quote, publish, settlement, txid and job events to the terminal as they happen.
+
+    Safe to call on every turn; events are printed once.
+    """
+    subscribe(_print_event)
+
+
+def stream_completion(env, messages, tools, console=None):
+    """Streams one completion to the terminal and returns the assistant message.
+
+    env.completions(stream=True) reads the whole stream before returning, so
+    the chunks come straight from the inference client. The message has the
+    content and tool_calls of a regular completion, ready for
+    run_tool_calls.
+    """
+    content = []
+    calls = {}
+
+    stream = env._run_inference_completions(messages, "", True, tools=tools)
+    with TerminalStream(console) as out:
+        for chunk in stream:
+            if not getattr(chunk, "choices", None):
+                continue
+            delta = chunk.choices[0].delta
+
+            if getattr(delta, "content", None):
+                content.append(delta.content)
+                out.write(delta.content)
+
+            for call in getattr(delta, "tool_calls", None) or []:
+                entry = calls.setdefault(call.index, SimpleNamespace(id=None, type="function", function=SimpleNamespace(name="", arguments="")))
+                if call.id:
+                    entry.id = call.id
+                if call.function and call.function.name:
+                    entry.function.name += call.function.name
+                if call.function and call.function.arguments:
+                    entry.function.arguments += call.function.arguments
+
+    return SimpleNamespace(role="assistant", content="".join(content), tool_calls=[calls[index] for index in sorted(calls)] or None)
+
+
+def run_tool_calls(env, message, add_responses_to_messages=False):
+    """Runs the tool calls of a streamed message the way completions_and_run_tools does.
+
+    Text tool calls in llama syntax are picked up too, a failing tool is
+    logged without ending the turn, and tool output is added to the thread
+    when add_responses_to_messages is set.
+    """
+    env._handle_tool_calls(message, add_responses_to_messages, "assistant", "tool")
@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+from decimal import Decimal
+
+TOKENS_FILE = "tokens.json"
+CATALOG_URL = "https://api-mng-console.chaindefuser.com/api/tokens"
+CATALOG_CACHE_FILE = ".tokens_cache.json"
+CATALOG_TTL = 300
+CATALOG_RETRY = 30
+# Fields the flows cannot do without; catalog entries missing one are skipped.
+REQUIRED_FIELDS = ("symbol", "blockchain", "defuse_asset_id", "decimals")
+
+
+class TokenRegistry:
+    """Token metadata indexed by symbol, (symbol, blockchain), contract address and defuse asset id."""
+
+    def __init__(self, tokens):
+        self.tokens = list(tokens)
+        self._by_symbol = {}
+        self._by_symbol_chain = {}
+        self._by_contract = {}
+        self._by_asset_id = {}
+        self._scale = {}
+
+        for token in self.tokens:
+            self._by_symbol.setdefault(token["symbol"], []).append(token)
+            self._by_symbol_chain.setdefault((token["symbol"], token["blockchain"]), token)
+            if token.get("contract_address"):
+                self._by_contract.setdefault(token["contract_address"], token)
+            self._by_asset_id.setdefault(token["defuse_asset_id"], token)
+            self._scale[token["defuse_asset_id"]] = Decimal(10) ** int(token["decimals"])
+
+    @classmethod
+    def from_file(cls, path=TOKENS_FILE):
+        with open(path, "r") as file:
+            return cls(json.load(file))
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def by_symbol(self, symbol):
+        return self._by_symbol.get(symbol.upper(), [])
+
+    def by_symbol_chain(self, symbol, blockchain):
+        return self._by_symbol_chain.get((symbol.upper(), blockchain))
+
+    def by_symbol_chains(self, symbol, blockchains):
+        return [token for token in self.by_symbol(symbol) if token["blockchain"] in blockchains]
+
+    def by_contract(self, contract_address):
+        return self._by_contract.get(contract_address)
+
+    def by_asset_id(self, defuse_asset_id):
+        return self._by_asset_id.get(defuse_asset_id)
+
+    def asset_ids(self):
+        return list(self._by_asset_id)
+
+    def scale(self, token):
+        """Returns 10 ** decimals for a token dict or defuse asset id."""
+        if isinstance(token, dict):
+            token = token["defuse_asset_id"]
+        return self._scale[token]
+
+
+class TokenCatalog:
+    """Last good token list from the catalog API, refreshed in the background.
+
+    Readers always get the current registry immediately. Once it is older than
+    `ttl` a background thread revalidates it with ETag/If-Modified-Since and
+    swaps in the new registry only when the API returns a non-empty list.
+    """
+
+    def __init__(self, fallback, url=CATALOG_URL, cache_file=CATALOG_CACHE_FILE, ttl=CATALOG_TTL, timeout=2):
+        self.url = url
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.timeout = timeout
+        self._registry = fallback
+        self._fallback = fallback
+        self._etag = None
+        self._last_modified = None
+        self._fetched_at = 0
+        self._attempted_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._session = None
+        self._cache_loaded = False
+
+    def registry(self):
+        # The cache file is read on first use so importing tokens does no I/O.
+        if not self._cache_loaded:
+            with self._lock:
+                if not self._cache_loaded:
+                    self._load_cache()
+                    self._cache_loaded = True
+
+        now = time.time()
+        if now - self._fetched_at > self.ttl and now - self._attempted_at > CATALOG_RETRY:
+            self._refresh_in_background()
+        return self._registry
+
+    def refresh(self):
+        """Fetches the catalog once. Returns True if a new token list was swapped in."""
+        import requests
+
+        if self._session is None:
+            self._session = requests.Session()
+        self._attempted_at = time.time()
+        headers = {}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+
+        try:
+            response = self._session.get(self.url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304:
+                self._fetched_at = time.time()
+                return False
+            response.raise_for_status()
+            items = response.json().get("items")
+        except (requests.RequestException, ValueError) as e:
+            print(f"Token catalog refresh failed: {e}")
+            return False
+
+        items = self._normalize(items)
+        if not items:
+            return False
+
+        self._registry = TokenRegistry(items)
+        self._etag = response.headers.get("ETag")
+        self._last_modified = response.headers.get("Last-Modified")
+        self._fetched_at = time.time()
+        self._save_cache(items)
+        return True
+
+    def _normalize(self, items):
+        """Drops entries the flows cannot use and fills in min_withdraw_amount.
+
+        The catalog API does not always send min_withdraw_amount, so it is
+        taken from the fallback token list, or "0" for tokens not in it.
+        """
+        fallback = self._fallback
+        tokens = []
+        for item in items:
+            if not isinstance(item, dict) or any(item.get(field) in (None, "") for field in REQUIRED_FIELDS):
+                continue
+            if item.get("min_withdraw_amount") is None:
+                known = fallback.by_asset_id(item["defuse_asset_id"])
+                item = dict(item, min_withdraw_amount=known.get("min_withdraw_amount", "0") if known else "0")
+            tokens.append(item)
+        return tokens
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="token-catalog-refresh", daemon=True).start()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, "r") as file:
+                cached = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        items = self._normalize(cached.get("items") or [])
+        if items:
+            self._registry = TokenRegistry(items)
+            self._etag = cached.get("etag")
+            self._last_modified = cached.get("last_modified")
+
+    def _save_cache(self, items):
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, "w") as file:
+                json.dump({"etag": self._etag, "last_modified": self._last_modified, "items": items}, file)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            print(f"Unable to write token catalog cache: {e}")
+
+
+class LazyRegistry:
+    """Stands in for the TokenRegistry of a tokens file and reads the file on first use."""
+
+    def __init__(self, path=TOKENS_FILE):
+        self.path = path
+        self._registry = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._registry is None:
+            with self._lock:
+                if self._registry is None:
+                    self._registry = TokenRegistry.from_file(self.path)
+        return self._registry
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+
+registry = LazyRegistry()
+catalog = TokenCatalog(registry)
@@ -1,120 +1,76 @@
+import asyncio
 import json
-import re
 import base64
 from nearai.agents.environment import Environment
-import requests
 from decimal import Decimal, ROUND_HALF_DOWN
-from rich.console import Console
-from rich.markdown import Markdown
+from functools import lru_cache
 from io import StringIO
 
 import zcash
-
-NEAR_BUFFER = 25000000000000000000000
-
-with open("tokens.json", "r") as file:
-    data = json.load(file)
-    meta_data = data
-    for token in meta_data:
-        token['min_withdraw_amount'] = Decimal(token['min_withdraw_amount']) / (Decimal(10) ** token['decimals'])
-
-main_prompt = f""" 
-  
-     Tool Usage Guidelines:
-        Before calling the tool, always reconfirm with the user regarding parameters of the function and call the tool only after user gives a positive response.
-        There is a chance you put wrong parameters in the tool so always reconfirm with the user before calling the tool.
-        Make sure you dont call a tool multiple times unless user tells you to do so.
-        NEVER CALL ANY TOOL WITHOUT USER CONFIRMATION.
-  
-   Always reply with MARKDOWN. the markdown you give is going to be formatted and hence needs to be in the standard format making good tables if needed. Dont care about spacing. make it like normal markdown.
-
-  General Guidelines: Always write to the user in the same language and tone as the user writes to you. Use the same words and phrases that the user uses. This will make the conversation more engaging and user-friendly.
-  
-    User Confirmation:
-
-        Always ask for explicit confirmation before using any tool.
-        Keep the interaction friendly and engaging—feel free to add a joke or a lighthearted comment.
-
-         Tool Usage Guidelines:
-        Before calling the tool, always reconfirm with the user regarding parameters of the function and call the tool only after user gives a positive response.
-        There is a chance you put wrong parameters in the tool so always reconfirm with the user before calling the tool.
-        Make sure you dont call a tool multiple times unless user tells you to do so.
-        NEVER CALL ANY TOOL WITHOUT USER CONFIRMATION.
-
-    Structured Output:
-
-        The first line of the output must be empty to ensure proper spacing.
-        Always reply with MARKDOWN.
-
-        For enhanced readability:
-        🔴 Red for errors. 
-        🟢 Green for success messages. 
-        🟡 Yellow for warnings.
-        🔵 Blue for informational messages.
-    
-        Example usage: \033[32mSuccess: Transaction completed!\033[0m \n \033[34m Here Is the Transaction Hash: txHash\033[0m
-
-
-    Formatting & Style Guidelines:
-        Wrap important information inside ASCII boxes.
-        Use text styling (bold, italics, colors) for better readability and emphasis.
-
-        Implement multi-line cell display for long text:
-            │ Token name with │ This is a very long │
-            │ extra info │ description that wraps │
-            
-    2️⃣ Section Headers & Separators
-        Use bold, capitalized, or ASCII-stylized headers for clarity.
-        Example:
-
-                                            ================================
-                                                🚀 SYSTEM STATUS REPORT 🚀
-                                            ================================
-                                        
-    3️⃣ Enhanced Readability & Structure
-    
-        Provide adequate spacing between sections.
-        Align text properly for a neat and structured appearance.
-        Use indents, lists, and bullet points to enhance readability.
-
-    Text Styling Instructions IMPORTANT:
-    Apply these exact ANSI codes for formatting:
-        Bold text: \033[1mYOUR_TEXT\033[0m
-        Italic text: \033[3mYOUR_TEXT\033[0m
-        Underlined text: \033[4mYOUR_TEXT\033[0m
-        
-    Apply these exact ANSI codes for colors:
-        Red text: \033[31mYOUR_TEXT\033[0m
-        Green text: \033[32mYOUR_TEXT\033[0m
-        Yellow text: \033[33mYOUR_TEXT\033[0m
-        Blue text: \033[34mYOUR_TEXT\033[0m
-        Magenta text: \033[35mYOUR_TEXT\033[0m
-        Cyan text: \033[36mYOUR_TEXT\033[0m
-
-
-    Additional Considerations:
-    
-        Do not dump raw JSON; instead, format it in a structured and readable way.
-        Provide as much useful and relevant information as possible while keeping the response concise and user-friendly.
-        Ensure outputs do not exceed terminal width to avoid formatting issues.
-        Basically format so that its easier for user to understand output.
-        THE OUTPUT SHOULD BE IN MARKDOWN. 
-        See the formatting instructions twice before replying.
-
-    Tool Usage Guidelines:
-        Before calling the tool, always reconfirm with the user regarding parameters of the function and call the tool only after user gives a positive response.
-        There is a chance you put wrong parameters in the tool so always reconfirm with the user before calling the tool.
-        Make sure you dont call a tool multiple times unless user tells you to do so.
-        NEVER CALL ANY TOOL WITHOUT USER CONFIRMATION.
-        Beautify all the jsons and outputs you get from tool calls before replying to the user.
-
-    IMPORTANT: These are the tokens supported along with the blockchains they are supported as well as their defuse-asset-ids and other metadata:
-    {meta_data}
-
-    Do notice that there is a `min_withdraw_amount` for each token.
-    """
+from addresses import classify
+from balances import fetch_balances, fetch_ft_balances, fetch_near_balance, wallet_row
+from render import render_reply
+from tokens import catalog
+
+WALLET_SOURCE_TIMEOUT = 5
+
+# Last good value per (source, account) so one slow source does not blank the whole wallet view.
+_last_wallet_sources = {}
+
+TOOL_GUIDELINES = """
+Tool Usage Guidelines:
+    Before calling a tool, always reconfirm its parameters with the user and call it only after the user gives a positive response. The parameters you filled in may be wrong.
+    Do not call a tool more than once unless the user tells you to.
+    NEVER CALL ANY TOOL WITHOUT USER CONFIRMATION.
+    Beautify all the outputs you get from tool calls before replying to the user.
+"""
+
+GENERAL_GUIDELINES = """
+General Guidelines:
+    Always write to the user in the same language, tone, words and phrases the user uses.
+    Keep the interaction friendly and engaging; feel free to add a joke or a lighthearted comment.
+"""
+
+FORMAT_GUIDELINES = """
+Formatting Guidelines:
+    Always reply with standard MARKDOWN; it is rendered for a terminal. Make good tables where useful and do not worry about spacing.
+    The first line of the output must be empty.
+    Mark messages with 🔴 errors, 🟢 success, 🟡 warnings and 🔵 information.
+    Use bold or capitalized section headers, lists and bullet points, and spacing between sections.
+    Wrap important information in ASCII boxes and wrap long table cells over several lines.
+    Text styling ANSI codes: bold \033[1mTEXT\033[0m, italic \033[3mTEXT\033[0m, underline \033[4mTEXT\033[0m.
+    Color ANSI codes: red \033[31mTEXT\033[0m, green \033[32mTEXT\033[0m, yellow \033[33mTEXT\033[0m, blue \033[34mTEXT\033[0m, magenta \033[35mTEXT\033[0m, cyan \033[36mTEXT\033[0m.
+    Example: \033[32mSuccess: Transaction completed!\033[0m \033[34mHere is the Transaction Hash: txHash\033[0m
+    Never dump raw JSON. Keep outputs within the terminal width, useful and concise.
+"""
+
+
+def token_table(data):
+    """Supported tokens as a symbol|chain|decimals|min_withdraw table, minimum withdraw amounts in whole tokens."""
+    rows = ["symbol|chain|decimals|min_withdraw"]
+    for token in data:
+        min_withdraw = (Decimal(token.get("min_withdraw_amount") or 0) / data.scale(token)).normalize()
+        rows.append(f"{token['symbol']}|{token['blockchain']}|{token['decimals']}|{min_withdraw:f}")
+    return "\n".join(rows)
+
+
+@lru_cache(maxsize=1)
+def build_main_prompt(data):
+    """System prompt for the agent. Asset ids and contracts are left to the token_info tool."""
+    return "\n".join([
+        GENERAL_GUIDELINES,
+        TOOL_GUIDELINES,
+        FORMAT_GUIDELINES,
+        "Supported tokens (withdrawals below min_withdraw fail; call token_info for defuse asset ids and contract addresses):",
+        token_table(data),
+    ])
+
+
+format_prompt = GENERAL_GUIDELINES + FORMAT_GUIDELINES
 
 def load_url(url):
+    import requests
+
     r = requests.get(url, timeout=2)
     r.raise_for_status()
     return r.json()
@@ -126,94 +82,116 @@ def add_to_log(env: Environment, message):
     except Exception as e:
         print(f"Error adding to log: {e}")
 
-def reply_with_markdown(env: Environment, data, prompt):
+def print_markdown(env: Environment, text):
+    from rich.console import Console
+    from rich.markdown import Markdown
+
+    console = Console()
+    md = Markdown(text)
+    with StringIO() as buf:
+        console.file = buf
+        console.print(md)
+        env.add_reply(buf.getvalue())
+
+def _llm_markdown(env: Environment, data, prompt):
+    messages = [{"role": "system", "content": format_prompt}, {"role": "system", "content": f"User has asked for {prompt}. Format this for markdown and give an extensive reply. {data}"}]
+    reply = env.completions_and_run_tools(messages, add_responses_to_messages=False)
+    message = reply.choices[0].message
+    (message_without_tool_call, tool_calls) = env._parse_tool_call(message)
+    return message_without_tool_call if message.content else None
+
+def reply_with_markdown(env: Environment, data, prompt, use_llm=None):
+    """Replies with a tool result formatted as Markdown.
+
+    Renders locally from templates unless `use_llm` is set or the
+    REPLY_FORMATTER env var is "llm", which asks the model to write the reply.
+    """
+    if use_llm is None:
+        use_llm = env.env_vars.get("REPLY_FORMATTER") == "llm"
+
     try:
-        messages = [{"role": "system", "content": main_prompt}, {"role": "system", "content": f"User has asked for {prompt}. Format this for markdown and give an extensive reply. {data}"}]
-        reply = env.completions_and_run_tools(messages, add_responses_to_messages=False)
-        message = reply.choices[0].message
-        (message_without_tool_call, tool_calls) = env._parse_tool_call(message)
-        if message.content:
-            console = Console()
-            md = Markdown(message_without_tool_call)
-            with StringIO() as buf:
-                console.file = buf
-                console.print(md)
-                env.add_reply(buf.getvalue())
+        text = _llm_markdown(env, data, prompt) if use_llm else render_reply(data, prompt)
+        if text:
+            print_markdown(env, text)
 
-        
     except Exception as e:
         print(f"Error adding to log: {e}")
 
-async def _wallet_balance(env: Environment, account_id, data_old):
-    data = (load_url("https://api-mng-console.chaindefuser.com/api/tokens"))
-    if data["items"] is None:
-        data = data_old
-    else:   
-        data = data["items"]
+async def _fetch_wallet_source(key, coro, timeout=WALLET_SOURCE_TIMEOUT):
+    """Awaits one balance source. On failure falls back to its last good value.
 
+    Returns (value, status) where status is "ok", "stale" or "unavailable".
+    """
     try:
-        # Fetch tokens (excluding NEAR)
-        token_response = requests.get(f"https://api.fastnear.com/v1/account/{account_id}/ft")
-        token_response.raise_for_status()  # Raise an exception for bad status codes
+        value = await asyncio.wait_for(coro, timeout)
+    except Exception as e:
+        print(f"Balance source {key[0]} failed for {key[1]}: {e!r}")
+        if key in _last_wallet_sources:
+            return _last_wallet_sources[key], "stale"
+        return None, "unavailable"
+
+    _last_wallet_sources[key] = value
+    return value, "ok"
+
+async def _zec_wallet_balance(env: Environment, address, data):
+    account = await zcash.getAccountForAddress(env, address)
+    return await zcash.account_balance(env, account, data)
+
+async def _wallet_balance(env: Environment, account_id):
+    data = catalog.registry()
+    zcash_address = env.env_vars.get("ZCASH_ADDRESS")
+
+    try:
+        (tokens, tokens_status), (near_balance, near_status), (zec, zec_status) = await asyncio.gather(
+            _fetch_wallet_source(("fastnear", account_id), fetch_ft_balances(account_id)),
+            _fetch_wallet_source(("nearblocks", account_id), fetch_near_balance(account_id)),
+            _fetch_wallet_source(("zcash", zcash_address), _zec_wallet_balance(env, zcash_address, data)),
+        )
 
-        
-        # Fetch NEAR balance
-        near_response = requests.get(f"https://api.nearblocks.io/v1/account/{account_id}")
-        near_response.raise_for_status()  # Raise an exception for bad status codes
-        
-        tokens = token_response.json().get("tokens", [])
-        near_balance = near_response.json().get("account", [{}])[0].get("amount", "0")
-        
-        # Process token balances
         token_balances = []
-        for token in tokens:
-            
-            entry = [item for item in data if item.get('contract_address') == token["contract_id"]]
-
-            if (len(entry) == 0):
-                continue
-
-            balance = (
-                str(((Decimal(token["balance"]) + Decimal(near_balance) - Decimal(NEAR_BUFFER)) / Decimal(Decimal(10) ** int(entry[0]["decimals"]))))
-                if token["contract_id"] == "wrap.near"
-                else str((Decimal(token["balance"]) / Decimal(Decimal(10) ** int(entry[0]["decimals"]))))
-            )
-            
-            if Decimal(balance) < 0:
-                balance = "0"
-
-            balance_usd = str((Decimal(entry[0]["price"]) * Decimal(balance)))
-            
-            if entry[0]["symbol"].upper() == "WNEAR":
-                    entry[0]["symbol"] = "NEAR"
-            
-            if Decimal(balance) <= 0:
-                continue
-            
-            token_balances.append({
-                "contractId": entry[0]["defuse_asset_id"].replace("nep141:", ""),
-                "symbol": entry[0]["symbol"],
-                "blockchain": entry[0]["blockchain"],
-                "balance": balance,
-                "balance_usd": balance_usd
-            })
-        
-        entry = [item for item in data if item.get('symbol') == "ZEC"]
 
-        account = zcash.getAccountForAddress(env, env.env_vars.get("ZCASH_ADDRESS"))
-        transparent_balance, shielded_balance = zcash.account_balance(env, account)
-        zec_balance = Decimal(transparent_balance) + Decimal(shielded_balance) - Decimal("0.0004")
-        if zec_balance < 0:
-            zec_balance = 0
+        if tokens is None:
+            token_balances.append({"source": "fastnear", "status": "unavailable"})
+        else:
+            for asset, balance in wallet_row(data, tokens, near_balance or "0").items():
+                if balance <= 0:
+                    continue
+
+                entry = data.by_asset_id(asset)
+                status = tokens_status
+                if entry.get("contract_address") == "wrap.near" and near_status != "ok" and status == "ok":
+                    status = near_status
+
+                token_balances.append({
+                    "contractId": entry["defuse_asset_id"].replace("nep141:", ""),
+                    "symbol": "NEAR" if entry["symbol"].upper() == "WNEAR" else entry["symbol"],
+                    "blockchain": entry["blockchain"],
+                    "balance": str(balance),
+                    "balance_usd": str(Decimal(entry.get("price", 0)) * balance),
+                    "status": status,
+                })
+        
+        entry = data.by_symbol_chain("ZEC", "zec")
+
+        if zec is None:
+            # A first wallet scan keeps running after the timeout; it is not a failure.
+            status = "indexing" if zcash.address_scan_running(env) else "unavailable"
+            token_balances.append({"source": "zcash", "symbol": entry["symbol"], "status": status})
+        else:
+            transparent_balance, shielded_balance = zec
+            zec_balance = Decimal(transparent_balance) + Decimal(shielded_balance) - Decimal("0.0004")
+            if zec_balance < 0:
+                zec_balance = 0
         
-        balance_usd = str((Decimal(entry[0]["price"]) * Decimal(zec_balance)))
-        token_balances.append({
-                "contractId": entry[0]["defuse_asset_id"].replace("nep141:", ""),
-                "symbol": f"{entry[0]['symbol']}",
-                "blockchain": entry[0]["blockchain"],
-                "balance": str(zec_balance),
-                "balance_usd": balance_usd
-            })
+            balance_usd = str((Decimal(entry.get("price", 0)) * Decimal(zec_balance)))
+            token_balances.append({
+                    "contractId": entry["defuse_asset_id"].replace("nep141:", ""),
+                    "symbol": f"{entry['symbol']}",
+                    "blockchain": entry["blockchain"],
+                    "balance": str(zec_balance),
+                    "balance_usd": balance_usd,
+                    "status": zec_status,
+                })
 
         if len(token_balances) == 0:
             return "You have no tokens in your wallet."
@@ -221,89 +199,34 @@ async def _wallet_balance(env: Environment, account_id, data_old):
         
         return json.dumps(token_balances)
     
-    except requests.RequestException as e:
-        raise Exception(f"Request failed: {e}")
     except Exception as e:
         raise Exception(f"Internal server error: {e}")
 
-async def _Intents_balance(env: Environment, account_id,data_old):
-    data = (load_url("https://api-mng-console.chaindefuser.com/api/tokens"))
-    if data["items"] is None:
-        data = data_old
-    else:
-        data = data["items"]
-    user_account_id = env.env_vars.get("ACCOUNT_ID")
-    user_private_key = env.env_vars.get("PRIVATE_KEY")
-    token_ids = [item["defuse_asset_id"] for item in data]
-    
-    args = {
-        "account_id": account_id,
-        "token_ids": token_ids,
-    }
-    
-    near = env.set_near(user_account_id,user_private_key)
-    try:
-        tr = await near.view("intents.near","mt_batch_balance_of",args)
-        balance = {}
-        balances = []
-                
-        for i in range(len(token_ids)):
-            if Decimal(tr.result[i]) > 0:
-                token = [item for item in data if item.get('defuse_asset_id') == token_ids[i]]
-                
-                if token[0]["symbol"].upper() == "WNEAR":
-                    token[0]["symbol"] = "NEAR"
-                
-                
-                prev = 0
-                if token[0]["symbol"] in balance:
-                    prev = Decimal(balance[token[0]["symbol"]]["amt"])
-                    
-                current = (Decimal(tr.result[i]) / Decimal(Decimal(10) ** int(token[0]["decimals"])))
-                    
-                balance[token[0]["symbol"]] = {
-                    "amt" : str(prev + current),
-                    "usd" : str(current * (Decimal(token[0]["price"])))
-                }
-        
-        for tk in balance:
-            
-            balances.append({"TOKEN":tk,
-                            "AMOUNT":balance[tk]["amt"],
-                            "AMOUNT_IN_USD": balance[tk]["usd"]})
-                
-        return balances
-    except Exception as e:
-        raise Exception(f"Internal server error: {e}")
+async def _Intents_balance(env: Environment, account_id):
+    result = await fetch_balances(env, near_accounts=[account_id], wallet=False)
+    if result["errors"]:
+        raise Exception(f"Internal server error: {'; '.join(result['errors'][account_id])}")
 
-def getAddressChains(env: Environment, address):
-    valid_chains = []
-    
-    if re.match(r'^(([a-z\d]+[-_])*[a-z\d]+\.)*([a-z\d]+[-_])*[a-z\d]+$', address):
-        valid_chains.append("near")
-    
-    if re.match(r'^0x[a-fA-F0-9]{40}$', address):
-        valid_chains.extend(["eth", "base", "arb", "gnosis", "bera"])
-    
-    if (re.match(r'^1[1-9A-HJ-NP-Za-km-z]{25,34}$', address) or
-        re.match(r'^3[1-9A-HJ-NP-Za-km-z]{25,34}$', address) or
-        re.match(r'^bc1[02-9ac-hj-np-z]{11,87}$', address) or
-        re.match(r'^bc1p[02-9ac-hj-np-z]{42,87}$', address)):
-        valid_chains.append("btc")
-    
-    # try:
-    #     if PublicKey(address).is_on_curve():
-    #         valid_chains.append("sol")
-    # except:
-    #     pass
-    
-    if re.match(r'^[DA][1-9A-HJ-NP-Za-km-z]{25,33}$', address):
-        valid_chains.append("doge")
-    
-    # if xrp_isValidClassicAddress(address) or xrp_isValidXAddress(address):
-    #     valid_chains.append("xrp")
-    
-    if zcash.validate_zcash_address(env, address)["isvalid"]:
+    data = catalog.registry()
+    balance = {}
+    for asset, amount in zip(result["assets"], result["intents"][0]):
+        amount = Decimal(amount)
+        if amount <= 0:
+            continue
+
+        token = data.by_asset_id(asset)
+        symbol = "NEAR" if token["symbol"].upper() == "WNEAR" else token["symbol"]
+        amt, usd = balance.get(symbol, (Decimal(0), Decimal(0)))
+        balance[symbol] = (amt + amount, usd + amount * Decimal(token.get("price", 0)))
+
+    return [{"TOKEN": tk, "AMOUNT": str(amt), "AMOUNT_IN_USD": str(usd)} for tk, (amt, usd) in balance.items()]
+
+async def getAddressChains(env: Environment, address):
+    info = classify(address)
+    valid_chains = list(info.chains)
+
+    # Only addresses the local checks cannot settle go to zcashd.
+    if info.ambiguous and (await zcash.validate_zcash_address(env, address))["isvalid"]:
         valid_chains.append("zec")
-    
+
     return valid_chains
\ No newline at end of file
@@ -0,0 +1,124 @@
+import json
+import os
+import time
+
+# Minimum seconds between full wallet rescans caused by unknown addresses.
+RESCAN_INTERVAL = 60
+# Suffix of the index file written next to ZCASH_ACCOUNT_FILE.
+INDEX_SUFFIX = ".addresses.json"
+
+
+class AddressIndex:
+    """Maps zcashd wallet addresses to their account.
+
+    Unified addresses, and each of their receivers from
+    z_listunifiedreceivers, resolve to the account that owns them. The
+    index is built from one listaddresses scan, extended as the agent
+    creates addresses, and saved to `path` so a restart does not rescan a
+    large wallet. Entries belong to the node they were read from; an index
+    saved for another node is ignored.
+    """
+
+    def __init__(self, path=None, node=None):
+        self.path = path
+        self.node = node
+        self.scanned = False
+        self._accounts = {}
+        self._receivers = {}
+        self._account_address = {}
+        self._scanned_at = 0
+        self._load()
+
+    def account_for(self, address):
+        return self._accounts.get(address)
+
+    def address_for(self, account):
+        """Returns the first unified address seen for the account, or None."""
+        return self._account_address.get(int(account))
+
+    def receivers(self, address):
+        """Returns the z_listunifiedreceivers result recorded for a unified address, or None."""
+        return self._receivers.get(address)
+
+    def unresolved(self, addresses):
+        return [address for address in addresses if address not in self._accounts]
+
+    def needs_scan(self):
+        """True when no scan has happened yet, or the last one is older than RESCAN_INTERVAL."""
+        return not self.scanned or time.monotonic() - self._scanned_at > RESCAN_INTERVAL
+
+    def add(self, address, account, receivers=None, save=True):
+        account = int(account)
+        self._accounts[address] = account
+        self._account_address.setdefault(account, address)
+        if receivers:
+            self._receivers[address] = receivers
+            for receiver in receivers.values():
+                if receiver:
+                    self._accounts.setdefault(receiver, account)
+        if save:
+            self.save()
+
+    def update(self, listaddresses):
+        """Indexes the unified addresses of a listaddresses result.
+
+        Returns the unified addresses that have no receivers recorded yet.
+        """
+        missing = []
+        for wallet in listaddresses or []:
+            for account_info in wallet.get("unified", []):
+                for addr in account_info.get("addresses") or []:
+                    if "address" not in addr:
+                        continue
+                    self.add(addr["address"], account_info["account"], save=False)
+                    if addr["address"] not in self._receivers:
+                        missing.append(addr["address"])
+
+        self.scanned = True
+        self._scanned_at = time.monotonic()
+        return missing
+
+    def save(self):
+        if not self.path:
+            return
+
+        state = {
+            "node": self.node,
+            "scanned": self.scanned,
+            "accounts": self._accounts,
+            "receivers": self._receivers,
+            "account_address": {str(account): address for account, address in self._account_address.items()},
+        }
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w") as file:
+                json.dump(state, file)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Could not save the address index to {self.path}: {e}")
+
+    def _load(self):
+        if not self.path:
+            return
+
+        try:
+            with open(self.path, "r") as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable address index {self.path}: {e}")
+            return
+
+        if state.get("node") != self.node:
+            return
+
+        self._accounts = {address: int(account) for address, account in state.get("accounts", {}).items()}
+        self._receivers = state.get("receivers", {})
+        self._account_address = {int(account): address for account, address in state.get("account_address", {}).items()}
+        # Known addresses resolve without a scan; the first unknown one rescans the wallet.
+        self.scanned = bool(state.get("scanned"))
+
+
+def index_path(account_file):
+    return f"{account_file}{INDEX_SUFFIX}" if account_file else None
@@ -1,111 +1,207 @@
 from decimal import Decimal
-import time
-import requests
-from requests.auth import HTTPBasicAuth
+import asyncio
+import itertools
+import httpx
 from nearai.agents.environment import Environment
 import json
 from intents.withdraw import withdraw_from_intents
+from addresses import classify
+from backoff import poll, OPERATION_POLL, BRIDGE_POLL, CONFIRMATION_POLL
+from chainwatch import ChainWatcher
+from journal import get_journal, complete, resumes
+from nearclient import get_near
+from progress import emit
+from runtime import get_http_client
+from walletindex import AddressIndex, index_path
 
 rpc_url = "https://bridge.chaindefuser.com/rpc"
 zcash_fees = Decimal("0.0002")
 zcash_account = None
+# Addresses per z_listunifiedreceivers batch when indexing the wallet.
+RECEIVERS_BATCH = 500
 
-with open("tokens.json", "r") as file:
-    data = json.load(file)
+# Read-only node methods that are safe to resend after a connection error or timeout.
+IDEMPOTENT_METHODS = {
+    "getbestblockhash",
+    "getblockcount",
+    "getmempoolinfo",
+    "getwalletinfo",
+    "listaddresses",
+    "z_getbalanceforaccount",
+    "z_getoperationstatus",
+    "z_listaccounts",
+    "z_listoperationids",
+    "z_listunifiedreceivers",
+    "z_validateaddress",
+}
 
-def createAccount(env: Environment):
-    username = env.env_vars.get("ZCASH_USER")
-    password = env.env_vars.get("ZCASH_PASS")
 
-    headers = {"Content-Type": "text/plain"}
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "z_getnewaccount",
-        "params": []
-    }
+class ZcashRpcClient:
+    """JSON-RPC client for zcashd on top of the shared keep-alive AsyncClient.
+
+    `call` and `batch` return the decoded JSON-RPC response objects, so callers
+    keep checking `response["result"]` as before. Idempotent methods are retried
+    on transport errors; everything else is sent exactly once.
+    """
+
+    def __init__(self, url, username, password, timeout=httpx.Timeout(30.0, connect=3.05), retries=3, backoff=0.5):
+        self.url = url
+        self.auth = (username, password)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._ids = itertools.count(1)
+
+    def _payload(self, method, params):
+        return {"jsonrpc": "1.0", "id": next(self._ids), "method": method, "params": list(params)}
+
+    async def _post(self, body, idempotent):
+        attempts = self.retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            try:
+                response = await get_http_client().post(
+                    self.url, json=body, auth=self.auth, headers={"Content-Type": "text/plain"}, timeout=self.timeout
+                )
+                return response.json()
+            except httpx.TransportError:
+                if attempt == attempts - 1:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def call(self, method, *params):
+        return await self._post(self._payload(method, params), method in IDEMPOTENT_METHODS)
+
+    async def batch(self, calls):
+        """Sends [(method, params), ...] in one round trip and returns the responses in order."""
+        payloads = [self._payload(method, params) for method, params in calls]
+        idempotent = all(method in IDEMPOTENT_METHODS for method, _ in calls)
+        responses = await self._post(payloads, idempotent)
+        by_id = {response.get("id"): response for response in responses}
+        return [by_id.get(payload["id"], {"result": None, "error": "missing response"}) for payload in payloads]
+
+
+_rpc_clients = {}
+
+
+def get_rpc_client(env: Environment):
+    key = (env.env_vars.get("ZCASH_NODE_URL"), env.env_vars.get("ZCASH_USER"), env.env_vars.get("ZCASH_PASS"))
+    if key not in _rpc_clients:
+        _rpc_clients[key] = ZcashRpcClient(*key)
+    return _rpc_clients[key]
+
+
+_chain_watchers = {}
+
+
+def get_chain_watcher(env: Environment, data):
+    """One ChainWatcher per node, using zcashd's ZMQ hashblock feed when ZCASH_ZMQ_URL is set."""
+    rpc = get_rpc_client(env)
+    if rpc not in _chain_watchers:
+        _chain_watchers[rpc] = ChainWatcher(rpc, lambda response: _pool_balances(response, data), zmq_url=env.env_vars.get("ZCASH_ZMQ_URL") or None)
+    return _chain_watchers[rpc]
+
+
+_address_indexes = {}
+
+
+def get_address_index(env: Environment):
+    """The address->account index for this node, saved next to ZCASH_ACCOUNT_FILE."""
+    rpc = get_rpc_client(env)
+    if rpc not in _address_indexes:
+        _address_indexes[rpc] = AddressIndex(index_path(env.env_vars.get("ZCASH_ACCOUNT_FILE")), env.env_vars.get("ZCASH_NODE_URL"))
+    return _address_indexes[rpc]
+
+
+_scans = {}
+
+
+def _start_scan(env: Environment, index):
+    """The running scan of the index, started if there is none."""
+    if index not in _scans:
+        task = asyncio.ensure_future(_scan_addresses(env, index))
+        _scans[index] = task
+        task.add_done_callback(lambda task: _scan_done(index, task))
+    return _scans[index]
+
+
+def _scan_done(index, task):
+    _scans.pop(index, None)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Wallet address scan failed: {task.exception()!r}")
+
+
+def address_scan_running(env: Environment):
+    """True while a wallet scan for the address index is in progress."""
+    return get_address_index(env) in _scans
+
+
+async def _scan_addresses(env: Environment, index):
+    """Indexes the wallet with one listaddresses call and one batch of z_listunifiedreceivers."""
+    rpc = get_rpc_client(env)
+    data = await rpc.call("listaddresses")
+
+    if "result" not in data:
+        raise ValueError("Invalid response: missing 'result' key")
+
+    missing = index.update(data["result"])
+    for start in range(0, len(missing), RECEIVERS_BATCH):
+        chunk = missing[start:start + RECEIVERS_BATCH]
+        responses = await rpc.batch([("z_listunifiedreceivers", [address]) for address in chunk])
+        for address, response in zip(chunk, responses):
+            if response.get("result"):
+                index.add(address, index.account_for(address), response["result"], save=False)
+    index.save()
+
 
-    node_url = env.env_vars.get("ZCASH_NODE_URL")
-    response = requests.post(node_url, json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
+async def _index_address(env: Environment, address, account):
+    response = await get_rpc_client(env).call("z_listunifiedreceivers", address)
+    get_address_index(env).add(address, account, response.get("result"))
+
+
+async def createAccount(env: Environment):
+    response = await get_rpc_client(env).call("z_getnewaccount")
 
     if response["result"]["account"]:
         return int(response["result"]["account"])
     
     return -1
 
-def getAddressForAccount(env: Environment, account):
-    username = env.env_vars.get("ZCASH_USER")
-    password = env.env_vars.get("ZCASH_PASS")
+async def getAddressForAccount(env: Environment, account):
+    rpc = get_rpc_client(env)
+    index = get_address_index(env)
 
-    headers = {"Content-Type": "text/plain"}
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "z_listaccounts",
-        "params": []
-    }
+    address = index.address_for(account)
+    if address:
+        return address
 
-    node_url = env.env_vars.get("ZCASH_NODE_URL")
-    response = requests.post(node_url, json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
+    response = await rpc.call("z_listaccounts")
     if response["result"][int(account)]["addresses"]:
-        return response["result"][int(account)]["addresses"][0]["ua"]
+        address = response["result"][int(account)]["addresses"][0]["ua"]
+        await _index_address(env, address, account)
+        return address
 
-    headers = {"Content-Type": "text/plain"}
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "z_getaddressforaccount",
-        "params": [int(account)]
-    }
-
-    response = requests.post(node_url, json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
+    response = await rpc.call("z_getaddressforaccount", int(account))
 
     if response["result"]["address"]:
+        await _index_address(env, response["result"]["address"], account)
         return response["result"]["address"]
     else:
         env.add_reply(f"Unable to make an address for the account {account} for app usage.")
         return ""
 
-def getAccountForAddress(env: Environment, address):
-    username = env.env_vars.get("ZCASH_USER")
-    password = env.env_vars.get("ZCASH_PASS")
-
-    headers = {"Content-Type": "text/plain"}
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "listaddresses",
-        "params": []
-    }
-
+async def getAccountForAddress(env: Environment, address):
     try:
-        data = requests.post(env.env_vars.get("ZCASH_NODE_URL"), json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
-        
-        if "result" not in data:
-            raise ValueError("Invalid response: missing 'result' key")
-        
-        list_addresses = data["result"]
-        
-        for wallet in list_addresses:
-            if "unified" not in wallet:
-                continue
-            for account_info in wallet["unified"]:
-                if "addresses" not in account_info or not isinstance(account_info["addresses"], list):
-                    continue
-                for addr in account_info["addresses"]:
-                    if "address" in addr and addr["address"] == address:
-                        return account_info["account"]
-        
-        return None  # Address not found
-    
-    except requests.exceptions.RequestException as e:
+        accounts = await getAccountsForAddresses(env, [address])
+        return accounts.get(address)  # None when the address is not in the wallet
+
+    except httpx.HTTPError as e:
         env.add_reply(f"Request error: {e}")
         return None
     except ValueError as e:
         env.add_reply(f"JSON parsing error: {e}")
         return None
 
-def getZcashIntentAccount(env: Environment):
+async def getZcashIntentAccount(env: Environment):
     try:
         # Open the file in read mode first to check existing content
         with open(env.env_vars.get("ZCASH_ACCOUNT_FILE"), "r") as file:
@@ -115,7 +211,7 @@ def getZcashIntentAccount(env: Environment):
 
     # If account is empty or -1, create a new account
     if account == -1:
-        account = createAccount(env)
+        account = await createAccount(env)
 
     # Validate the account 
     try:
@@ -135,57 +231,22 @@ def getZcashIntentAccount(env: Environment):
 
     return zcash_account
 
-def validate_zcash_address(env: Environment, address):
-    username = env.env_vars.get("ZCASH_USER")
-    password = env.env_vars.get("ZCASH_PASS")
+async def validate_zcash_address(env: Environment, address):
+    info = classify(address)
+    if not info.ambiguous:
+        return {"isvalid": info.zcash_type is not None, "address_type": info.zcash_type or "invalid"}
 
-    headers = {"Content-Type": "text/plain"}
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "z_validateaddress",
-        "params": [
-            address
-        ]
-    }
-
-    node_url = env.env_vars.get("ZCASH_NODE_URL")
-    response = requests.post(node_url, json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
+    response = await get_rpc_client(env).call("z_validateaddress", address)
     if not response["result"]["isvalid"]:
         return {"isvalid": response["result"]["isvalid"], "address_type": "invalid"}
     return {"isvalid": response["result"]["isvalid"], "address_type": response["result"]["address_type"]}
 
-def wallet_balance(env: Environment):
-    username = env.env_vars.get("ZCASH_USER")
-    password = env.env_vars.get("ZCASH_PASS")
-
-    headers = {"Content-Type": "text/plain"}
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "getwalletinfo",
-        "params": []
-    }
-
-    node_url = env.env_vars.get("ZCASH_NODE_URL")
-    response = requests.post(node_url, json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
+async def wallet_balance(env: Environment):
+    response = await get_rpc_client(env).call("getwalletinfo")
     return response["result"]["balance"], response["result"]["shielded_balance"]
 
-def account_balance(env: Environment, account):
-    username = env.env_vars.get("ZCASH_USER")
-    password = env.env_vars.get("ZCASH_PASS")
-
-    token_data = [obj for obj in data if obj["symbol"] == 'ZEC'][0]
-
-    headers = {"Content-Type": "text/plain"}
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "z_getbalanceforaccount",
-        "params": [int(account)]
-    }
-
-    response = requests.post(env.env_vars.get("ZCASH_NODE_URL"), json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
+def _pool_balances(response, data):
+    token_data = data.by_symbol_chain("ZEC", "zec")
 
     balance_transparent = 0
     balance_shielded = 0
@@ -194,111 +255,158 @@ def account_balance(env: Environment, account):
         pools = response["result"]["pools"]
 
         if pools and "transparent" in pools and pools["transparent"]["valueZat"]:
-            balance_transparent = Decimal(pools["transparent"]["valueZat"]) / (Decimal(10) ** int(token_data["decimals"]))
+            balance_transparent = Decimal(pools["transparent"]["valueZat"]) / data.scale(token_data)
 
         if pools and "sapling" in pools and pools["sapling"]["valueZat"]:
-            balance_shielded = Decimal(pools["sapling"]["valueZat"]) / (Decimal(10) ** int(token_data["decimals"]))
+            balance_shielded = Decimal(pools["sapling"]["valueZat"]) / data.scale(token_data)
 
         if pools and "orchard" in pools and pools["orchard"]["valueZat"]:
-            balance_shielded = balance_shielded + Decimal(pools["orchard"]["valueZat"]) / (Decimal(10) ** int(token_data["decimals"]))
+            balance_shielded = balance_shielded + Decimal(pools["orchard"]["valueZat"]) / data.scale(token_data)
 
     return balance_transparent, balance_shielded
 
+async def account_balance(env: Environment, account, data):
+    response = await get_rpc_client(env).call("z_getbalanceforaccount", int(account))
+    return _pool_balances(response, data)
 
+async def account_balances(env: Environment, accounts, data):
+    """Returns {account: (transparent, shielded)} for several accounts in one batched round trip."""
+    accounts = list(dict.fromkeys(int(account) for account in accounts))
+    if not accounts:
+        return {}
+    responses = await get_rpc_client(env).batch([("z_getbalanceforaccount", [account]) for account in accounts])
+    return {account: _pool_balances(response, data) for account, response in zip(accounts, responses)}
 
-def transfer(env: Environment, sender, amount, recipient, args = [1, str(zcash_fees), 'NoPrivacy']):
-    username = env.env_vars.get("ZCASH_USER")
-    password = env.env_vars.get("ZCASH_PASS")
+async def getAccountsForAddresses(env: Environment, addresses):
+    """Returns {address: account} for every address found in the wallet.
 
-    headers = {"Content-Type": "text/plain"}
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "z_sendmany",
-        "params": [
-            sender,
-            [
-                {
-                    "address": recipient,
-                    "amount": str(Decimal(amount) - zcash_fees)
-                }
-            ],
-        ]
-    }
+    Answers from the address index, rescanning the wallet only when an
+    address is unknown and the last scan is older than RESCAN_INTERVAL.
+    """
+    index = get_address_index(env)
 
-    payload["params"].extend(args)
+    if index.unresolved(addresses) and (index in _scans or index.needs_scan()):
+        # Shielded so a caller that gives up, like a balance timeout, does not
+        # cancel a long first scan; the next caller joins the same scan.
+        await asyncio.shield(_start_scan(env, index))
 
-    node_url = env.env_vars.get("ZCASH_NODE_URL")
-    response = requests.post(node_url, json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
+    return {address: index.account_for(address) for address in addresses if index.account_for(address) is not None}
+
+
+async def transfer(env: Environment, sender, amount, recipient, args = [1, str(zcash_fees), 'NoPrivacy'], flow=None, step="transfer"):
+    """Sends with z_sendmany and waits for the txid.
+
+    With a journal `flow`, the operation id is recorded under `step` so a
+    resumed flow polls the same operation instead of sending twice.
+    """
+    rpc = get_rpc_client(env)
+
+    if flow is not None and flow.reached(step):
+        return flow.state[f"{step}_txid"]
+
+    if flow is not None and flow.reached(f"{step}_submitted"):
+        return await _wait_for_operation(env, flow.state[f"{step}_opid"], flow, step)
+
+    if flow is not None and flow.reached(f"{step}_sending"):
+        env.add_reply(f"The process stopped while sending {amount} ZEC to {recipient}. Please check the wallet before retrying.")
+        return None
+
+    params = [
+        sender,
+        [
+            {
+                "address": recipient,
+                "amount": str(Decimal(amount) - zcash_fees)
+            }
+        ],
+    ]
+    params.extend(args)
+
+    if flow is not None:
+        flow.record(f"{step}_sending", **{f"{step}_recipient": recipient, f"{step}_amount": str(amount)})
+
+    response = await rpc.call("z_sendmany", *params)
     if not response["result"]:
         return False
     opid = response["result"]
 
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "z_listoperationids",
-        "params": []
-    }
+    if flow is not None:
+        flow.record(f"{step}_submitted", **{f"{step}_opid": opid})
 
-    response = requests.post(node_url, json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
+    return await _wait_for_operation(env, opid, flow, step)
+
+
+async def _wait_for_operation(env: Environment, opid, flow=None, step="transfer"):
+    rpc = get_rpc_client(env)
+
+    # The operation list and the first status poll go out in one round trip.
+    operation_ids, response = await rpc.batch([("z_listoperationids", []), ("z_getoperationstatus", [[opid]])])
     
-    if opid not in response["result"]:
+    if opid not in (operation_ids["result"] or []):
         return opid
 
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "z_getoperationstatus",
-        "params": [
-            [opid]
-        ]
-    }
+    async def operation_finished():
+        nonlocal response
+        if response is None:
+            response = await rpc.call("z_getoperationstatus", [opid])
+        current, response = response, None
 
-    start_time = time.time()
-    timeout = 300
-    
-    while True:
-        response = requests.post(node_url, json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
-        if response["result"] and response["result"][0]:  # Check if result is available
-            result = response["result"][0]
-
-            if result["status"] == "success":
-                txid = result["result"]["txid"]
-                return txid
-            elif result["status"] == "failed":
-                env.add_reply(result)
-                return None
-        
-        if time.time() - start_time > timeout:  # Check if 2 minutes have passed
-            env.add_reply("Timeout: Operation did not complete within 2 minutes")
-            return None  # Or handle timeout case accordingly
-        
-        time.sleep(2)
+        if current["result"] and current["result"][0]:  # Check if result is available
+            result = current["result"][0]
+            if result["status"] in ("success", "failed"):
+                return result
+        return None
+
+    result = await poll(operation_finished, 300, **OPERATION_POLL)
+
+    if result is None:
+        env.add_reply("Timeout: Operation did not complete within 5 minutes")
+        if flow is not None:
+            flow.suspend(f"operation {opid} still running")
+        return None  # Or handle timeout case accordingly
 
+    if result["status"] == "success":
+        txid = result["result"]["txid"]
+        if flow is not None:
+            flow.record(step, **{f"{step}_txid": txid})
+        emit("txid", chain="zec", txid=txid)
+        return txid
 
+    env.add_reply(result)
+    return None
 
 
-async def deposit(env: Environment, sender, amount):
+
+
+async def deposit(env: Environment, sender, amount, data, flow=None):
+    flow = flow or get_journal().start("zec_deposit", {"sender": sender, "amount": str(amount)})
+    if flow.finished:
+        return flow.state.get("result")
+    return await complete(flow, _deposit(env, sender, amount, data, flow))
+
+
+@resumes("zec_deposit")
+async def _resume_deposit(env: Environment, data, flow):
+    return await deposit(env, flow.params["sender"], flow.params["amount"], data, flow)
+
+
+async def _deposit(env: Environment, sender, amount, data, flow):
     
     user_account_id = env.env_vars.get("ACCOUNT_ID")
-    username = env.env_vars.get("ZCASH_USER")
-    password = env.env_vars.get("ZCASH_PASS")
 
-    headers = {"Content-Type": "text/plain"}
+    account = await getAccountForAddress(env, sender)
+    balance_transparent, balance_shielded = await account_balance(env, account, data)
 
-    account = getAccountForAddress(env, sender)
-    balance_transparent, balance_shielded = account_balance(env, account)
-
-    match = [obj for obj in data if obj["symbol"] == "ZEC"]
-    token_data = match[0]
+    token_data = data.by_symbol_chain("ZEC", "zec")
 
     amount = Decimal(amount) + Decimal(zcash_fees)
-    if Decimal(amount) > Decimal(balance_shielded) + Decimal(balance_transparent):
+    # Once a transfer has gone out the balances no longer reflect the request.
+    resumed = flow.reached("shield_sending") or flow.reached("deposit_sending")
+    if not resumed and Decimal(amount) > Decimal(balance_shielded) + Decimal(balance_transparent):
         env.add_reply(f"You have insufficiant balance of {Decimal(balance_shielded) + Decimal(balance_transparent)}. Cannot deposit {amount}")
         return False
 
-    if Decimal(amount) > Decimal(balance_shielded) and Decimal(amount) < Decimal(balance_shielded) + Decimal(balance_transparent):
+    if flow.reached("shield_sending") or (not resumed and Decimal(amount) > Decimal(balance_shielded) and Decimal(amount) < Decimal(balance_shielded) + Decimal(balance_transparent)):
         args = [
             1,
             str(zcash_fees),
@@ -306,24 +414,19 @@ async def deposit(env: Environment, sender, amount):
         ]
 
         amount = Decimal(amount) + Decimal(zcash_fees)
-        txid = transfer(env, sender, amount, sender, args)
+        txid = await transfer(env, sender, amount, sender, args, flow, "shield")
         if not txid:
             return False
         
         env.add_reply(f"Transaction Id: {txid}")
         
-        start_time = time.time()
-        timeout = 300
-        while True:
-            _, shielded = account_balance(account)
-            if Decimal(shielded) > Decimal(amount):
-                break
-            
-            if time.time() - start_time > timeout:  # Check if 5 minutes have passed
-                env.add_reply("Timeout: Operation did not complete within 5 minutes")
-                return None
+        def shielded(transparent, shielded):
+            return Decimal(shielded) > Decimal(amount)
 
-            time.sleep(2)
+        if not flow.reached("deposit_sending") and not await get_chain_watcher(env, data).wait_for_balance(account, shielded, 300):
+            env.add_reply("Timeout: Operation did not complete within 5 minutes")
+            flow.suspend("shielding transfer not confirmed yet")
+            return None
 
     payload = {
         "jsonrpc": "2.0",
@@ -337,7 +440,7 @@ async def deposit(env: Environment, sender, amount):
     
     # wait unitl the amount gets confirmed on intents
     
-    response = requests.post(rpc_url, json=payload).json()
+    response = (await get_http_client().post(rpc_url, json=payload)).json()
     deposit_address = response["result"]["address"]
 
     args = [
@@ -346,47 +449,50 @@ async def deposit(env: Environment, sender, amount):
         "NoPrivacy"
     ]
 
-    txid = transfer(env, sender, amount, deposit_address, args)
+    txid = await transfer(env, sender, amount, deposit_address, args, flow, "deposit")
+    if not txid:
+        return False
     env.add_reply(f"Transaction Id: {txid}")
     
-    start_time = time.time()
-    timeout = 600
-    
     user_account_id = env.env_vars.get("ACCOUNT_ID", None)
-    user_private_key = env.env_vars.get("PRIVATE_KEY", None)
-    near = env.set_near(user_account_id, user_private_key)
+    near = get_near(env)
     
     args = {
         "account_id": user_account_id,
         "token_ids": ["nep141:zec.omft.near"],
     }
     
-    while True:
+    async def credited():
         tr = await near.view("intents.near", "mt_batch_balance_of", args)
-        zec_balance = Decimal(tr.result[0]) / Decimal(Decimal(10) ** int(token_data["decimals"]))
-        
-        if Decimal(zec_balance) >= Decimal(amount) - Decimal(zcash_fees):
-            break
-        
-        if time.time() - start_time > timeout:  # Check if 5 minutes have passed
-            return txid
-        
-        time.sleep(10)
-        
+        zec_balance = Decimal(tr.result[0]) / data.scale(token_data)
+        return Decimal(zec_balance) >= Decimal(amount) - Decimal(zcash_fees)
+
+    # The bridge credits the deposit once it is confirmed; give up waiting after 10 minutes.
+    await poll(credited, 600, **CONFIRMATION_POLL)
     return txid
 
-async def withdraw(env: Environment, token, amount, recipient, data):
-    username = env.env_vars.get("ZCASH_USER")
-    password = env.env_vars.get("ZCASH_PASS")
-    headers = {"Content-Type": "text/plain"}
+async def withdraw(env: Environment, token, amount, recipient, data, flow=None):
+    flow = flow or get_journal().start("zec_withdraw", {"token": token, "amount": str(amount), "recipient": recipient})
+    if flow.finished:
+        return flow.state.get("result")
+    return await complete(flow, _withdraw(env, token, amount, recipient, data, flow))
+
+
+@resumes("zec_withdraw")
+async def _resume_withdraw(env: Environment, data, flow):
+    return await withdraw(env, flow.params["token"], flow.params["amount"], flow.params["recipient"], data, flow)
+
+
+async def _withdraw(env: Environment, token, amount, recipient, data, flow):
+    rpc = get_rpc_client(env)
     
-    obj = validate_zcash_address(env, recipient)
+    obj = await validate_zcash_address(env, recipient)
     is_valid, address_type = obj["isvalid"], obj["address_type"]
     if not is_valid:
         env.add_reply(f"Address {recipient} is not valid for zcash chain.")
         return False
 
-    match = [obj for obj in data if obj["symbol"] == token.upper()]
+    match = data.by_symbol(token)
 
     if not match:
       env.add_reply(f"Token {token} may not be supported for this app.")
@@ -395,32 +501,26 @@ async def withdraw(env: Environment, token, amount, recipient, data):
     token_data = match[0]
 
     if address_type in ("p2pkh", "p2sh"):
-        return await withdraw_from_intents(env, token, amount, recipient, data)
+        return await withdraw_from_intents(env, token, amount, recipient, data, token_data, flow)
     
-    account = getZcashIntentAccount(env)
+    account = await getZcashIntentAccount(env)
     if account == -1:
         return False
     
     
-    unified_address = getAddressForAccount(env, account)
+    unified_address = await getAddressForAccount(env, account)
 
     if not unified_address:
         return False
 
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "z_listunifiedreceivers",
-        "params": [unified_address]
-    }
-
-    node_url = env.env_vars.get("ZCASH_NODE_URL")
-    response = requests.post(node_url, json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
+    receivers = get_address_index(env).receivers(unified_address)
+    if not receivers:
+        receivers = (await rpc.call("z_listunifiedreceivers", unified_address))["result"]
 
-    transparent_address = response["result"]["p2pkh"] or response["result"]["p2sh"]
-    shielded_address = response["result"]["sapling"] or response["result"]["orchard"]
+    transparent_address = receivers["p2pkh"] or receivers["p2sh"]
 
-    result = await withdraw_from_intents(env, token, amount, transparent_address, data)
+    intents_flow = flow.child("intents_withdraw", {"token": token, "amount": str(amount), "receiver_id": transparent_address})
+    result = await withdraw_from_intents(env, token, amount, transparent_address, data, token_data, intents_flow)
     if not result:
         return False
     
@@ -433,14 +533,12 @@ async def withdraw(env: Environment, token, amount, recipient, data):
         }]
     }
     
-    start_time = time.time()
-    timeout = 600
-    hash = None
     to_print = True
-    to_break = 3
-    
-    while True:
-        response = requests.post(rpc_url, json=payload).json()
+    misses = 0
+
+    async def bridged():
+        nonlocal to_print, misses
+        response = (await get_http_client().post(rpc_url, json=payload)).json()
         
         if "result" in response:
             res = response["result"]
@@ -452,50 +550,33 @@ async def withdraw(env: Environment, token, amount, recipient, data):
                 status = withdrawals["status"]
 
                 if status != "PENDING":
-                    break
+                    flow.record("bridged", transfer_tx_hash=hash, bridge_status=status)
+                    return True
                 
                 if to_print:
                     env.add_reply(f"Transaction Hash: {hash}")
                     to_print = False
                     
         else:
-            if to_break < 0:
-                break
-            to_break = to_break - 1
-            time.sleep(5)
-
-        if time.time() - start_time > timeout:  # Check if 5 minutes have passed
-            env.add_reply("Timeout: Operation did not complete within 5 minutes")
-            return None
-    
-        time.sleep(2)
-
-
-    payload = {
-        "jsonrpc": "1.0",
-        "id": "curltest",
-        "method": "z_getbalanceforaccount",
-        "params": [int(account)]
-    }
+            # The relay may not know the withdrawal yet; stop asking after a few misses.
+            if misses > 3:
+                return True
+            misses = misses + 1
 
-    start_time = time.time()
-    timeout = 600
-
-    while True:
-        response = requests.post(node_url, json=payload, headers=headers, auth=HTTPBasicAuth(username, password)).json()
-        if response["result"]:
-            pools = response["result"]["pools"]
+        return False
 
-            if pools and pools["transparent"] and pools["transparent"]["valueZat"]:
-                balance = Decimal(pools["transparent"]["valueZat"]) / (Decimal(10) ** int(token_data["decimals"]))
-                if Decimal(amount) - zcash_fees <= balance:
-                    break
+    if not flow.reached("bridged") and not await poll(bridged, 600, **BRIDGE_POLL):
+        env.add_reply("Timeout: Operation did not complete within 10 minutes")
+        flow.suspend("bridge withdrawal still pending")
+        return None
 
-        if time.time() - start_time > timeout:  # Check if 5 minutes have passed
-            env.add_reply("Timeout: Operation did not complete within 5 minutes")
-            return None
+    def received(transparent, shielded):
+        return Decimal(amount) - zcash_fees <= transparent
 
-        time.sleep(2)
+    if not flow.reached("send_sending") and not await get_chain_watcher(env, data).wait_for_balance(account, received, 600):
+        env.add_reply("Timeout: Operation did not complete within 10 minutes")
+        flow.suspend("bridged funds not received yet")
+        return None
 
     args = [
         1,
@@ -503,6 +584,6 @@ async def withdraw(env: Environment, token, amount, recipient, data):
         "AllowRevealedSenders"
     ]
 
-    txid = transfer(env, unified_address, amount, recipient, args)
+    txid = await transfer(env, unified_address, amount, recipient, args, flow, "send")
     env.add_reply(f"Transaction Hash: {txid}")
     return txid
\ No newline at end of file